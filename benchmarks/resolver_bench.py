@@ -0,0 +1,253 @@
+"""Benchmark the music cog's stream and search resolvers against local stand-ins.
+
+Starts the stand-in Piped/Invidious/YouTube server from standins.py, points a
+real Music cog at it, and drives each resolver with unique video ids and
+queries (so no cache ever answers) at a fixed concurrency. yt-dlp is the one
+upstream that is not stood in: it fails immediately, which is what makes
+resolve_stream and search_youtube walk their fallbacks.
+
+Reports success rate, throughput and p50/p95/p99 latency per resolver, how
+the stand-ins answered, and the cog's own per-stage histograms. Everything
+runs on 127.0.0.1, so it works offline and in CI.
+
+    python benchmarks/resolver_bench.py [--scenario healthy] [--requests 200] [--concurrency 16]
+    python benchmarks/resolver_bench.py --scenario flaky --set piped.latency=0.3 --set youtube.malformed_rate=0.5
+    python benchmarks/resolver_bench.py --scenario all --check
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from standins import INVIDIOUS, PIPED, YOUTUBE, LoopbackHTTPClient, Profile, StandInServer  # noqa: E402
+
+BASE = {
+    PIPED: Profile(latency=0.03, jitter=0.01),
+    INVIDIOUS: Profile(latency=0.05, jitter=0.02),
+    YOUTUBE: Profile(latency=0.08, jitter=0.03),
+}
+
+# Scenario name -> (profile changes per service, minimum success rate per resolver for --check)
+SCENARIOS = {
+    'healthy': (
+        {},
+        {'piped': 1.0, 'invidious': 1.0, 'direct': 1.0, 'direct_search': 1.0,
+         'search_youtube': 1.0, 'resolve_stream': 1.0},
+    ),
+    'flaky': (
+        {PIPED: {'error_rate': 0.3}, INVIDIOUS: {'forbidden_rate': 0.3}, YOUTUBE: {'malformed_rate': 0.2}},
+        # Search asks one Invidious and one Piped mirror before scraping, so ~2% find nothing
+        {'resolve_stream': 0.99, 'search_youtube': 0.95},
+    ),
+    'malformed': (
+        {PIPED: {'malformed_rate': 0.5}, INVIDIOUS: {'malformed_rate': 0.5}, YOUTUBE: {'malformed_rate': 0.5}},
+        {},
+    ),
+    'slow-piped': (
+        {PIPED: {'latency': 1.5, 'jitter': 0.2}},
+        {'resolve_stream': 1.0, 'search_youtube': 1.0},
+    ),
+    'mirror-outage': (
+        {PIPED: {'error_rate': 1.0}, INVIDIOUS: {'error_rate': 1.0}},
+        {'direct': 1.0, 'direct_search': 1.0, 'resolve_stream': 1.0, 'search_youtube': 1.0},
+    ),
+}
+
+RESOLVERS = ('piped', 'invidious', 'direct', 'direct_search', 'search_youtube', 'resolve_stream')
+
+
+def build_profiles(scenario, overrides):
+    changes, _ = SCENARIOS[scenario]
+    profiles = {service: profile.copy(**changes.get(service, {})) for service, profile in BASE.items()}
+    for override in overrides:
+        target, _, value = override.partition('=')
+        service, _, setting = target.partition('.')
+        if service not in profiles or not value:
+            raise SystemExit(f"Bad --set {override!r}, expected e.g. piped.latency=0.2")
+        profiles[service] = profiles[service].copy(**{setting: float(value)})
+    return profiles
+
+
+def make_cog(base_url):
+    import cogs.music as music
+
+    def offline_extract(url, opts=None, download=False):
+        raise Exception("yt-dlp is offline in the resolver benchmark")
+
+    bot = types.SimpleNamespace(loop=asyncio.get_running_loop(), user=types.SimpleNamespace(id=0))
+    cog = music.Music(bot)
+    cog._extract_info = offline_extract
+    cog.http = LoopbackHTTPClient(
+        base_url,
+        connect_timeout=cog.http.timeout.connect,
+        read_timeout=cog.http.timeout.sock_read,
+        total_timeout=cog.http.timeout.total
+    )
+    return cog
+
+
+def call_for(cog, resolver, index):
+    """The coroutine for request ``index``; any truthy result counts as success."""
+    from cogs.music_support.track import Track
+
+    video_id = f"{RESOLVERS.index(resolver):02d}b{index:08d}"
+    query = f"{resolver} query {index}"
+    if resolver == 'piped':
+        return cog.get_piped_stream(video_id)
+    if resolver == 'invidious':
+        return cog.get_invidious_stream(video_id)
+    if resolver == 'direct':
+        return cog.get_direct_stream(video_id)
+    if resolver == 'direct_search':
+        return cog.direct_search(query)
+    if resolver == 'search_youtube':
+        return cog.search_youtube(query)
+    track = Track(f"https://www.youtube.com/watch?v={video_id}")
+    return cog.resolve_stream(track, 'benchmark', allow_download=False)
+
+
+async def run_resolver(base_url, resolver, requests, concurrency):
+    # Fresh caches and mirror health for every run
+    os.chdir(tempfile.mkdtemp(prefix=f'{resolver}-', dir=os.environ['DATA_DIR']))
+    cog = make_cog(base_url)
+    await cog.cog_load()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    successes = 0
+
+    async def one(index):
+        nonlocal successes
+        async with semaphore:
+            coro = call_for(cog, resolver, index)
+            started = time.perf_counter()
+            try:
+                result = await coro
+            except Exception:
+                result = None
+            latencies.append(time.perf_counter() - started)
+            if result:
+                successes += 1
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(one(index) for index in range(requests)))
+    finally:
+        elapsed = time.perf_counter() - started
+        stages = cog.metrics.snapshot()['stages']
+        await cog.cog_unload()
+
+    return {
+        'requests': requests,
+        'success': successes / requests,
+        'throughput': requests / elapsed,
+        'latencies': latencies,
+        'stages': stages,
+    }
+
+
+def percentile(values, q):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method='inclusive')[q - 1]
+
+
+def ms(seconds):
+    return f"{seconds * 1000:9.1f}"
+
+
+def report(scenario, profiles, results, server):
+    print(f"\n== {scenario} ==")
+    for service, profile in profiles.items():
+        print(f"  {service:<10} {profile!r}")
+
+    print(f"\n  {'resolver':<16}{'ok':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for resolver, result in results.items():
+        latencies = result['latencies']
+        print(f"  {resolver:<16}{result['success']:>7.1%}{result['throughput']:>9.1f}"
+              f"{ms(percentile(latencies, 50))}{ms(percentile(latencies, 95))}"
+              f"{ms(percentile(latencies, 99))}{ms(max(latencies))}")
+
+    print("\n  stand-in answers: " + ", ".join(
+        f"{service} " + "/".join(f"{outcome} {count}" for outcome, count in counts.items())
+        for service, counts in server.outcome_table()
+    ))
+
+    stages = {}
+    for result in results.values():
+        for name, summary in result['stages'].items():
+            stages.setdefault(name, []).append(summary)
+    if stages:
+        print("  cog stages (p95 ms): " + ", ".join(
+            f"{name} {max(s['p95'] or 0 for s in summaries) * 1000:.0f}"
+            for name, summaries in sorted(stages.items())
+        ))
+
+
+async def run_scenario(scenario, args):
+    profiles = build_profiles(scenario, args.set)
+    server = await StandInServer(profiles, seed=args.seed).start()
+    results = {}
+    try:
+        for resolver in args.resolvers:
+            # The cogs' error prints are expected noise under fault injection
+            quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with quiet:
+                results[resolver] = await run_resolver(server.base_url, resolver, args.requests, args.concurrency)
+    finally:
+        await server.stop()
+
+    report(scenario, profiles, results, server)
+
+    failures = []
+    for resolver, minimum in SCENARIOS[scenario][1].items():
+        if resolver in results and results[resolver]['success'] < minimum:
+            failures.append(f"{scenario}/{resolver}: {results[resolver]['success']:.1%} < {minimum:.0%}")
+    return failures
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', default='healthy', choices=sorted(SCENARIOS) + ['all'])
+    parser.add_argument('--requests', type=int, default=200, help="requests per resolver")
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--resolvers', nargs='+', default=list(RESOLVERS), choices=RESOLVERS)
+    parser.add_argument('--set', action='append', default=[], metavar='SERVICE.SETTING=VALUE',
+                        help="override a stand-in setting, e.g. piped.error_rate=0.5")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check', action='store_true', help="exit 1 if a scenario's success floor is missed")
+    parser.add_argument('--verbose', action='store_true', help="show the cog's own log output")
+    args = parser.parse_args()
+
+    scenarios = sorted(SCENARIOS) if args.scenario == 'all' else [args.scenario]
+    failures = []
+    for scenario in scenarios:
+        failures += await run_scenario(scenario, args)
+
+    if failures:
+        print("\nBelow the expected success rate:\n  " + "\n  ".join(failures))
+    return 1 if failures and args.check else 0
+
+
+if __name__ == '__main__':
+    # The cog keeps its caches and mirror health under .private in the working directory
+    with tempfile.TemporaryDirectory(prefix='resolver-bench-') as workdir:
+        os.chdir(workdir)
+        os.environ['DATA_DIR'] = workdir
+        import cogs.music  # noqa: E402,F401  (reads DATA_DIR at import, so only after the chdir)
+        if '--verbose' not in sys.argv:
+            logging.getLogger('music_cog').setLevel(logging.CRITICAL)
+        status = asyncio.run(main())
+        os.chdir(ROOT)
+    sys.exit(status)
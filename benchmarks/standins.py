@@ -0,0 +1,210 @@
+"""Local stand-ins for the Piped, Invidious and YouTube endpoints the music cog calls.
+
+One aiohttp server answers for every upstream host. Requests are routed by
+path, the way the real services lay out their APIs, and each service has a
+``Profile`` that adds latency and injects 502s, 403s and malformed payloads
+at configurable rates. ``LoopbackHTTPClient`` is a drop-in for the cog's
+``HTTPClient`` that sends every request to the stand-in server instead of
+the internet, so the resolvers run unmodified over real sockets.
+"""
+import asyncio
+import json
+import random
+import time
+import urllib.parse
+import zlib
+from collections import Counter
+
+from aiohttp import web
+
+from cogs.music_support.http_client import HTTPClient
+
+PIPED = 'piped'
+INVIDIOUS = 'invidious'
+YOUTUBE = 'youtube'
+
+
+class Profile:
+    """How one stand-in service behaves."""
+
+    def __init__(self, latency=0.02, jitter=0.01, error_rate=0.0, forbidden_rate=0.0, malformed_rate=0.0):
+        self.latency = latency  # seconds added to every response
+        self.jitter = jitter  # uniform +/- spread around ``latency``
+        self.error_rate = error_rate  # share of 502 Bad Gateway answers
+        self.forbidden_rate = forbidden_rate  # share of 403 Forbidden answers
+        self.malformed_rate = malformed_rate  # share of truncated JSON / HTML without data
+
+    def copy(self, **changes):
+        profile = Profile(self.latency, self.jitter, self.error_rate, self.forbidden_rate, self.malformed_rate)
+        for name, value in changes.items():
+            if not hasattr(profile, name):
+                raise ValueError(f"Unknown profile setting: {name}")
+            setattr(profile, name, value)
+        return profile
+
+    def __repr__(self):
+        return (f"latency={self.latency}s±{self.jitter}s error={self.error_rate:.0%} "
+                f"403={self.forbidden_rate:.0%} malformed={self.malformed_rate:.0%}")
+
+
+def stream_url(video_id):
+    expire = int(time.time()) + 6 * 3600
+    return f"https://rr1---sn-standin.googlevideo.com/videoplayback?expire={expire}&id={video_id}&itag=251"
+
+
+def search_ids(query, count=10):
+    """Stable, valid-looking video ids for a search query."""
+    seed = zlib.crc32(query.encode('utf-8')) % 10 ** 6
+    return [f"s{seed:06d}{index:04d}" for index in range(count)]
+
+
+class StandInServer:
+    """aiohttp server playing every upstream the resolvers know about."""
+
+    def __init__(self, profiles, seed=0):
+        self.profiles = profiles  # service -> Profile
+        self.random = random.Random(seed)
+        self.hits = Counter()  # (service, outcome) -> count
+        self.runner = None
+        self.base_url = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def service_for(self, path):
+        if path.startswith('/api/v1/') or path == '/latest_version':
+            return INVIDIOUS
+        if path in ('/watch', '/results'):
+            return YOUTUBE
+        return PIPED
+
+    async def handle(self, request):
+        path = request.path
+        service = self.service_for(path)
+        profile = self.profiles[service]
+
+        delay = profile.latency + self.random.uniform(-profile.jitter, profile.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        roll = self.random.random()
+        if roll < profile.error_rate:
+            self.hits[service, '502'] += 1
+            return web.Response(status=502, text='Bad Gateway')
+        roll -= profile.error_rate
+        if roll < profile.forbidden_rate:
+            self.hits[service, '403'] += 1
+            return web.Response(status=403, text='Forbidden')
+        roll -= profile.forbidden_rate
+        malformed = roll < profile.malformed_rate
+
+        self.hits[service, 'malformed' if malformed else 'ok'] += 1
+        if service == YOUTUBE:
+            return self.youtube(request, malformed)
+        if service == INVIDIOUS:
+            return self.invidious(request, malformed)
+        return self.piped(request, malformed)
+
+    def json_response(self, data, malformed):
+        body = json.dumps(data)
+        if malformed:
+            body = body[:len(body) // 2]
+        return web.Response(text=body, content_type='application/json')
+
+    def piped(self, request, malformed):
+        path = request.path
+        if path.startswith('/streams/'):
+            video_id = path.rsplit('/', 1)[-1]
+            return self.json_response({
+                'title': f"Stand-in {video_id}",
+                'duration': 215,
+                'audioStreams': [{'url': stream_url(video_id), 'mimeType': 'audio/webm', 'bitrate': 160000}],
+                'videoStreams': [],
+            }, malformed)
+        if path == '/search':
+            query = request.query.get('q', '')
+            return self.json_response([
+                {'id': video_id, 'title': f"{query} #{index}", 'duration': 180 + index}
+                for index, video_id in enumerate(search_ids(query))
+            ], malformed)
+        return web.Response(status=404, text='Not Found')
+
+    def invidious(self, request, malformed):
+        path = request.path
+        if path.startswith('/api/v1/videos/'):
+            video_id = path.rsplit('/', 1)[-1]
+            return self.json_response({
+                'title': f"Stand-in {video_id}",
+                'lengthSeconds': 215,
+                'adaptiveFormats': [{'type': 'audio/webm; codecs="opus"', 'url': stream_url(video_id)}],
+            }, malformed)
+        if path == '/api/v1/search':
+            query = request.query.get('q', '')
+            return self.json_response([
+                {'videoId': video_id, 'title': f"{query} #{index}", 'lengthSeconds': 180 + index, 'author': 'Stand-in'}
+                for index, video_id in enumerate(search_ids(query))
+            ], malformed)
+        if path == '/latest_version':
+            if malformed:
+                return web.Response(text='<html>', content_type='text/html')
+            return web.Response(text=stream_url(request.query.get('id', '')), content_type='text/plain')
+        return web.Response(status=404, text='Not Found')
+
+    def youtube(self, request, malformed):
+        if request.path == '/watch':
+            video_id = request.query.get('v', '')
+            if malformed:
+                return web.Response(text='<html><body>consent</body></html>', content_type='text/html')
+            player_response = json.dumps({
+                'videoDetails': {'videoId': video_id, 'title': f"Stand-in {video_id}"},
+                'streamingData': {'adaptiveFormats': [{'mimeType': 'audio/webm; codecs="opus"', 'url': stream_url(video_id)}]},
+            })
+            html = f"<html><script>var ytInitialPlayerResponse = {player_response};</script></html>"
+            return web.Response(text=html, content_type='text/html')
+
+        query = request.query.get('search_query', '')
+        links = '' if malformed else ''.join(
+            f'<a title="{query} #{index}" href="/watch?v={video_id}"></a>'
+            for index, video_id in enumerate(search_ids(query))
+        )
+        return web.Response(text=f"<html><body>{links}</body></html>", content_type='text/html')
+
+    def outcome_table(self):
+        rows = []
+        for service in (PIPED, INVIDIOUS, YOUTUBE):
+            counts = {outcome: self.hits[service, outcome] for outcome in ('ok', '502', '403', 'malformed')}
+            rows.append((service, counts))
+        return rows
+
+
+class LoopbackHTTPClient(HTTPClient):
+    """HTTPClient that sends every request to the stand-in server.
+
+    The upstream host travels in a header so the original URL's path and
+    query reach the stand-in unchanged. Every upstream shares one loopback
+    host here, so the per-host pool limit is lifted to the global one.
+    """
+
+    def __init__(self, base_url, **kwargs):
+        super().__init__(**kwargs)
+        self.limit_per_host = self.limit
+        self.base_url = base_url
+
+    async def get(self, url, headers=None, timeout=None):
+        parts = urllib.parse.urlsplit(url)
+        local_url = self.base_url + parts.path + (f"?{parts.query}" if parts.query else '')
+        headers = dict(headers or {}, **{'X-Upstream-Host': parts.netloc})
+        return await super().get(local_url, headers=headers, timeout=timeout)
@@ -0,0 +1,117 @@
+"""Benchmark the %play source router against the regex cascade it replaced.
+
+Checks every query in url_corpus.txt against its expected kind and cache key,
+then times classification of the whole corpus.
+
+    python benchmarks/url_router_bench.py [--rounds 2000]
+"""
+import argparse
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cogs.music_support.router import classify  # noqa: E402
+
+CORPUS = Path(__file__).with_name('url_corpus.txt')
+
+
+def load_corpus():
+    cases = []
+    for line in CORPUS.read_text(encoding='utf-8').splitlines():
+        if not line.strip() or line.startswith('#'):
+            continue
+        kind, key, query = line.split('\t', 2)
+        cases.append((kind, key, query))
+    return cases
+
+
+# The per-query work %play used to do before the router existed
+def legacy_extract_youtube_id(url):
+    watch_v_match = re.search(r'(?:youtube\.com\/watch\?v=|youtube\.com\/watch\?.+&v=)([a-zA-Z0-9_-]{11})', url)
+    if watch_v_match:
+        return watch_v_match.group(1)
+    youtube_regex = r'(?:youtube\.com\/(?:[^\/\n\s]+\/\S+\/|(?:v|e(?:mbed)?)\/|\S*?[?&]v=)|(?:youtu\.be|music\.youtube\.com)\/([a-zA-Z0-9_-]{11}))'
+    match = re.search(youtube_regex, url)
+    if match:
+        return match.group(1)
+    if 'youtube.com' in url or 'youtu.be' in url or 'music.youtube.com' in url:
+        for pattern in (
+            r'[?&]v=([a-zA-Z0-9_-]{11})',
+            r'youtu\.be\/([a-zA-Z0-9_-]{11})',
+            r'music\.youtube\.com\/watch\?v=([a-zA-Z0-9_-]{11})',
+            r'youtube\.com\/embed\/([a-zA-Z0-9_-]{11})',
+        ):
+            found = re.search(pattern, url)
+            if found:
+                return found.group(1)
+    for potential_id in re.findall(r'([a-zA-Z0-9_-]{11})', url):
+        if re.match(r'^[a-zA-Z0-9_-]{11}$', potential_id):
+            return potential_id
+    return None
+
+
+def legacy_is_youtube_url(url):
+    for domain in ('youtube.com', 'youtu.be', 'www.youtube.com', 'm.youtube.com',
+                   'music.youtube.com', 'youtube-nocookie.com'):
+        if domain in url:
+            return True
+    for pattern in (
+        r'(?:https?://)?(?:www\.)?youtube\.com/watch\?(?:.*&)?v=[\w-]+(?:&.*)?',
+        r'(?:https?://)?(?:www\.)?youtu\.be/[\w-]+(?:\?.*)?',
+        r'(?:https?://)?(?:www\.)?youtube\.com/embed/[\w-]+(?:\?.*)?',
+        r'(?:https?://)?(?:www\.)?youtube\.com/v/[\w-]+(?:\?.*)?',
+        r'(?:https?://)?(?:www\.)?youtube\.com/user/[\w-]+(?:/.*)?',
+        r'(?:https?://)?(?:www\.)?youtube\.com/channel/[\w-]+(?:/.*)?',
+        r'(?:https?://)?(?:www\.)?music\.youtube\.com/watch\?(?:.*&)?v=[\w-]+(?:&.*)?',
+    ):
+        if re.match(pattern, url, re.IGNORECASE):
+            return True
+    return False
+
+
+def legacy_classify(query):
+    re.match(r'https?://[^/]*spotify\.com/track/([a-zA-Z0-9]+)', query)
+    url_pattern = re.compile(
+        r'^(?:http|ftp)s?://'
+        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'
+        r'localhost|'
+        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
+        r'(?::\d+)?'
+        r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+    if not url_pattern.match(query):
+        return None
+    if legacy_is_youtube_url(query):
+        return legacy_extract_youtube_id(query)
+    return query
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=2000, help='passes over the corpus per timing')
+    args = parser.parse_args()
+
+    cases = load_corpus()
+    failures = 0
+    for kind, key, query in cases:
+        route = classify(query)
+        if (route.kind, route.key) != (kind, key):
+            failures += 1
+            print(f"MISMATCH {query!r}: got ({route.kind}, {route.key}), expected ({kind}, {key})")
+    print(f"{len(cases) - failures}/{len(cases)} corpus queries classified as expected")
+
+    queries = [query for _, _, query in cases]
+    timings = {}
+    for name, func in (('router', classify), ('legacy cascade', legacy_classify)):
+        seconds = min(timeit.repeat(lambda: [func(q) for q in queries], number=args.rounds, repeat=3))
+        timings[name] = seconds / (args.rounds * len(queries)) * 1e6
+        print(f"{name:>15}: {timings[name]:.2f} µs/query")
+    print(f"{'speedup':>15}: {timings['legacy cascade'] / timings['router']:.1f}x")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
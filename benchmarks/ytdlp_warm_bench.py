@@ -0,0 +1,110 @@
+"""Compare cold and warm yt-dlp extraction.
+
+cold: a new YoutubeDL per extraction with an empty cache directory, which
+      is what every call cost before the pool existed
+warm: the music cog's YoutubeDLPool, one reused instance with a persistent
+      cache directory
+
+By default both extract a small audio file from a local HTTP server, so the
+numbers isolate per-call setup cost and run offline. Pass --url with a real
+video to include YouTube's player JavaScript handling (needs network).
+
+    python benchmarks/ytdlp_warm_bench.py [--rounds 20] [--url https://www.youtube.com/watch?v=...]
+"""
+import argparse
+import functools
+import http.server
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import yt_dlp  # noqa: E402
+
+from cogs.music_support.ydl_pool import YoutubeDLPool  # noqa: E402
+
+OPTIONS = {
+    'format': 'bestaudio/best',
+    'quiet': True,
+    'no_warnings': True,
+    'noplaylist': True,
+}
+
+
+def serve_sample(directory):
+    """Serve a few KB of MPEG audio frames over HTTP on 127.0.0.1."""
+    (Path(directory) / 'sample.mp3').write_bytes(b'\xff\xfb\x90\x64' + b'\x00' * 16 * 1024)
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/sample.mp3"
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def cold(url):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        with yt_dlp.YoutubeDL(dict(OPTIONS, cachedir=cache_dir)) as ydl:
+            return ydl.extract_info(url, download=False)
+
+
+def timed(func, rounds):
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        info = func()
+        samples.append(time.perf_counter() - started)
+        if not info or not info.get('url'):
+            raise SystemExit("Extraction returned no stream URL")
+    return samples
+
+
+def describe(name, samples):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"  {name:<6} first {samples[0] * 1000:8.1f} ms   mean {statistics.mean(samples) * 1000:8.1f} ms   "
+          f"p50 {statistics.median(samples) * 1000:8.1f} ms   p95 {p95 * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--url', help="extract this URL instead of the local sample (needs network)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = None
+        url = args.url
+        if url is None:
+            server, url = serve_sample(workdir)
+
+        # Extractor classes are imported once per process either way; keep that out of both columns
+        cold(url)
+
+        pool = YoutubeDLPool(Path(workdir) / 'yt-dlp-cache')
+
+        def warm():
+            with pool.instance(OPTIONS) as ydl:
+                return ydl.extract_info(url, download=False)
+
+        print(f"{args.rounds} extractions of {url}")
+        cold_samples = timed(lambda: cold(url), args.rounds)
+        warm_samples = timed(warm, args.rounds)
+        describe('cold', cold_samples)
+        describe('warm', warm_samples)
+        print(f"  speedup {statistics.mean(cold_samples) / statistics.mean(warm_samples):.1f}x (mean), "
+              f"{pool.stats()['created']} pooled instance built in {pool.stats()['avg_setup'] * 1000:.1f} ms")
+
+        if server is not None:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
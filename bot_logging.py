@@ -0,0 +1,137 @@
+import atexit
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+from pathlib import Path
+
+# > Logging Pipeline <
+# Loggers only ever put records on an in-memory queue; a QueueListener thread
+# formats them and does the file and console I/O. A slow disk or a flood of
+# records therefore never blocks the event loop: when the queue is full, new
+# records are dropped and counted instead of waited on. The log file rotates
+# by size (or by time with LOG_ROTATE_WHEN) and rotated files are gzipped on
+# the writer thread. Noisy loggers get a repeat filter attached to the logger
+# itself, so suppressed records are discarded before they are even queued.
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Loggers that can spin in reconnect loops, plus our own
+NOISY_LOGGERS = ('discord.gateway', 'discord.voice_state', 'discord.voice_client', 'discord.player', 'music_cog')
+
+_listener = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RepeatFilter(logging.Filter):
+    """Lets through ``burst`` records per message template every ``interval`` seconds.
+
+    The first record after a quiet period says how many were suppressed.
+    """
+
+    def __init__(self, burst=5, interval=60.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.windows = {}  # (logger, template) -> [window start, seen, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self.windows[key] = [now, 1, 0]
+                if len(self.windows) > 1000:
+                    # Forget templates that have gone quiet
+                    self.windows = {k: w for k, w in self.windows.items() if now - w[0] < self.interval}
+            elif window[1] < self.burst:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def _file_handler(path):
+    backups = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    when = os.getenv('LOG_ROTATE_WHEN')
+    if when:
+        handler = logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backups, encoding='utf-8')
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=int(float(os.getenv('LOG_MAX_MB', '10')) * 1024 * 1024),
+            backupCount=backups,
+            encoding='utf-8'
+        )
+    handler.namer = lambda name: f"{name}.gz"
+    handler.rotator = _gzip_rotator
+    return handler
+
+
+def setup_logging(log_dir='.private', level=logging.INFO):
+    """Route every log record through a queue to a background writer thread"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_dir = Path(log_dir)
+    log_dir.mkdir(exist_ok=True)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = _file_handler(log_dir / 'bot.log')
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DroppingQueueHandler(log_queue))
+
+    repeat_filter = RepeatFilter()
+    for name in NOISY_LOGGERS:
+        logging.getLogger(name).addFilter(repeat_filter)
+
+
+def stop_logging():
+    """Flush whatever is still queued and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
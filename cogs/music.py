@@ -1,17 +1,15 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import yt_dlp
 import asyncio
+import itertools
 import re
 import traceback
-import requests
 from bs4 import BeautifulSoup
 import json
 import urllib.parse
-import random
 import os
 import io
-import aiohttp
 import time
 from pathlib import Path
 import subprocess
@@ -20,35 +18,45 @@ import sys
 from dotenv import load_dotenv
 import logging
 
-
-class VoiceGatewayDiagnosticHandler(logging.Handler):
-    """Captures the latest voice WebSocket close code from discord.py logs."""
-
-    close_code_pattern = re.compile(r'WebSocket closed with (\d+)')
+from cogs.music_support.audio_cache import AudioFileCache
+from cogs.music_support.broadcast import BroadcastHub
+from cogs.music_support.cache import LoudnessIndex, SearchCache, SpotifyCache, StreamCache
+from cogs.music_support.extract_process import ProcessExtractor
+from cogs.music_support.hedge import hedged_race
+from cogs.music_support.http_client import HTTPClient
+from cogs.music_support.instance_health import InstanceHealthRegistry, mirror_payload
+from cogs.music_support.loudness import MAX_MEASURE_SECONDS, gain_for, measure_loudness, with_gain
+from cogs.music_support.metrics import PlaybackMetrics
+from cogs.music_support.player import ADVANCE, FINISHED, SKIP, STOP, GuildPlayer
+from cogs.music_support.recovery import TrackedSource, resume_position, seek_options
+from cogs.music_support.resolver import ResolverPool, ResolverCancelled, check_cancelled
+from cogs.music_support.router import SEARCH, SPOTIFY_TRACK, YOUTUBE_PLAYLIST, classify
+from cogs.music_support.scheduler import PRIORITY_WARM, ResourceScheduler, SchedulerSaturated
+from cogs.music_support.track import Track, EXPIRY_MARGIN, format_duration
+from cogs.music_support.ydl_pool import YoutubeDLPool
+
+class VoiceCloseCodeFilter(logging.Filter):
+    """Captures the latest voice WebSocket close code from discord.py logs.
+
+    Attached to the discord.voice_state logger. It reads the close code from
+    the record's arguments or attached ConnectionClosed instead of formatting
+    and regex-searching every message, and never drops a record.
+    """
 
     def __init__(self, cog):
-        super().__init__(level=logging.INFO)
+        super().__init__()
         self.cog = cog
 
-    def emit(self, record):
-        message = record.getMessage()
-        match = self.close_code_pattern.search(message)
-        if match:
-            self.cog.note_voice_close_code(int(match.group(1)))
-
-# Create private directory for sensitive files
-private_dir = Path('.private')
-private_dir.mkdir(exist_ok=True)
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(private_dir / 'bot.log'),
-        logging.StreamHandler()
-    ]
-)
+    def filter(self, record):
+        code = None
+        if record.exc_info and isinstance(record.exc_info[1], discord.errors.ConnectionClosed):
+            code = record.exc_info[1].code
+        elif isinstance(record.msg, str) and 'close code' in record.msg and record.args:
+            code = record.args[0]
+        if isinstance(code, int):
+            self.cog.note_voice_close_code(code)
+        return True
+
 logger = logging.getLogger('music_cog')
 
 # Load environment variables
@@ -56,38 +64,82 @@ load_dotenv()
 
 MIN_DISCORD_DAVE_VERSION = (2, 7, 0)
 
+# Seconds to wait after the bot leaves voice before deciding it was not a reconnect
+VOICE_GONE_GRACE = 5.0
+
+DATA_DIR = os.getenv('DATA_DIR', '.')
+
+def data_file(name):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, name)
+
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.voice_clients = {}
-        self.current_songs = {}
-        self.current_urls = {}
-        self.loop_enabled = {}
-        self.skip_requested = set()
-        self.queue = {}
-        self.search_results = {}
-        self.stream_cache = {}  # Cache for successful stream URLs
-        self.cache_timeout = 3600  # Cache timeout in seconds (1 hour)
+        self.players = {}  # guild id -> GuildPlayer, only while the guild uses the bot
         self.last_voice_close_code = None
         self.last_voice_close_time = 0.0
 
+        # Background resolution of upcoming queue entries
+        self.prefetching = {}  # id(track) -> in-flight resolution task
+        self.default_prefetch_depth = int(os.getenv('MUSIC_PREFETCH_DEPTH', '2'))
+        self.playlist_limit = int(os.getenv('MUSIC_PLAYLIST_LIMIT', '500'))
+        # %playmany: items per command and how many are resolved at once
+        self.bulk_limit = int(os.getenv('MUSIC_BULK_LIMIT', '50'))
+        self.bulk_concurrency = int(os.getenv('MUSIC_BULK_CONCURRENCY', '4'))
+        self.music_settings = self.load_music_settings()
+
+        # Leave voice after this long without audio (or paused), or this long without listeners
+        self.idle_timeout = float(os.getenv('MUSIC_IDLE_TIMEOUT', '300'))
+        self.alone_timeout = float(os.getenv('MUSIC_ALONE_TIMEOUT', '60'))
+        self.paused_timeout = float(os.getenv('MUSIC_PAUSED_TIMEOUT', '1800'))
+
         # Create private directories
         self.private_dir = Path('.private')
         self.private_dir.mkdir(exist_ok=True)
         
+        # Resolved stream URLs, persisted so they survive restarts
+        self.stream_cache = StreamCache(
+            self.private_dir / 'music_cache.sqlite3',
+            max_entries=int(os.getenv('MUSIC_STREAM_CACHE_SIZE', '2000'))
+        )
+        # Search results and Spotify lookups, so repeat requests cost no upstream calls
+        self.search_cache = SearchCache(
+            self.private_dir / 'music_cache.sqlite3',
+            max_entries=int(os.getenv('MUSIC_SEARCH_CACHE_SIZE', '5000')),
+            ttl=int(os.getenv('MUSIC_SEARCH_CACHE_TTL', str(6 * 3600)))
+        )
+        self.spotify_cache = SpotifyCache(self.private_dir / 'music_cache.sqlite3')
+        # Measured loudness per track; later plays are normalized with a fixed gain
+        self.loudness_index = LoudnessIndex(self.private_dir / 'music_cache.sqlite3')
+        self.loudness_enabled = os.getenv('MUSIC_LOUDNESS', '1') != '0'
+        self.loudness_target = float(os.getenv('MUSIC_LOUDNESS_TARGET', '-14'))
+        self.loudness_max_jobs = int(os.getenv('MUSIC_LOUDNESS_JOBS', '2'))
+        # Cached Opus files keep codec copy unless their correction is larger than this (dB)
+        self.loudness_copy_tolerance = float(os.getenv('MUSIC_LOUDNESS_COPY_TOLERANCE', '3'))
+        self.loudness_jobs = set()  # Measurement tasks in flight
+        self.loudness_measuring = set()  # Their loudness keys
+
         # Create cache directory inside private directory
         self.cache_dir = self.private_dir / 'temp_audio'
         self.cache_dir.mkdir(exist_ok=True)
+        self.audio_cache = AudioFileCache(
+            self.cache_dir,
+            max_bytes=int(os.getenv('MUSIC_AUDIO_CACHE_MB', '1024')) * 1024 * 1024
+        )
         
         self.cookies_file = Path('youtube_cookies.txt')
+        self._extractor_classes = None
         
         # YT-DLP configuration with more robust settings
         self.ydl_opts = {
             'format': 'bestaudio/best',
+            # Downloads are kept as Opus in Ogg: webm/opus sources are remuxed
+            # without re-encoding and then played with codec copy
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
+                'preferredcodec': 'opus',
+                'preferredquality': '128',
             }],
             'noplaylist': True,
             'quiet': True,
@@ -123,6 +175,11 @@ class Music(commands.Cog):
             'before_options': '-nostdin -reconnect 1 -reconnect_streamed 1 -reconnect_at_eof 1 -reconnect_on_network_error 1 -reconnect_delay_max 5 -loglevel warning',
             'options': '-vn -bufsize 1024k -af aresample=async=1:first_pts=0',
         }
+        # Cached Opus files are only repackaged, never decoded, so no filters here
+        self.FFMPEG_COPY_OPTIONS = {
+            'before_options': '-nostdin -loglevel warning',
+            'options': '-vn',
+        }
         
         # Initialize instance lists
         self.piped_instances = [
@@ -145,16 +202,166 @@ class Music(commands.Cog):
             "https://invidious.private.coffee"
         ]
 
-        self.voice_diagnostic_handler = VoiceGatewayDiagnosticHandler(self)
-        logging.getLogger('discord.voice_state').addHandler(self.voice_diagnostic_handler)
+        # Latency/success scores and circuit breakers for the mirrors above
+        self.instance_health = InstanceHealthRegistry(
+            self.private_dir / 'instance_health.json',
+            failure_threshold=int(os.getenv('MUSIC_INSTANCE_FAILURE_THRESHOLD', '3')),
+            cooldown=float(os.getenv('MUSIC_INSTANCE_COOLDOWN', '120'))
+        )
+        self.instance_health.register('piped', self.piped_instances)
+        self.instance_health.register('invidious', self.invidious_instances)
+
+        # All yt-dlp work runs on this pool so it never blocks the event loop.
+        # The scheduler admits jobs fairly across guilds, current track first.
+        resolver_workers = int(os.getenv('MUSIC_RESOLVER_WORKERS', '4'))
+        self.resolver_scheduler = ResourceScheduler(
+            'resolver',
+            global_limit=resolver_workers,
+            per_guild_limit=int(os.getenv('MUSIC_RESOLVER_GUILD_LIMIT', '2')),
+            max_waiting=int(os.getenv('MUSIC_RESOLVER_MAX_WAITING', '50'))
+        )
+        # Each worker reuses its own YoutubeDL; player JS is cached on disk across restarts
+        self.ydl_pool = YoutubeDLPool(self.private_dir / 'yt-dlp-cache')
+        self.resolver = ResolverPool(
+            max_workers=resolver_workers,
+            timeout=float(os.getenv('MUSIC_RESOLVER_TIMEOUT', '45')),
+            scheduler=self.resolver_scheduler
+        )
+        # Optionally move metadata extraction into worker processes, off the bot's GIL
+        self.process_extractor = None
+        extraction_processes = int(os.getenv('MUSIC_EXTRACTION_PROCESSES', '0'))
+        if extraction_processes > 0:
+            self.process_extractor = ProcessExtractor(
+                extraction_processes, self.private_dir / 'yt-dlp-cache', self.ydl_opts
+            )
+        # Every playing pipeline holds one ffmpeg process
+        self.ffmpeg_scheduler = ResourceScheduler(
+            'ffmpeg',
+            global_limit=int(os.getenv('MUSIC_MAX_FFMPEG_PROCESSES', '32')),
+            max_waiting=int(os.getenv('MUSIC_RESOLVER_MAX_WAITING', '50'))
+        )
+        # Guilds playing the same track share one pipeline
+        self.broadcast = None
+        if os.getenv('MUSIC_BROADCAST', '1') != '0':
+            self.broadcast = BroadcastHub(float(os.getenv('MUSIC_BROADCAST_BUFFER_SECONDS', '300')))
+        self.download_timeout = float(os.getenv('MUSIC_DOWNLOAD_TIMEOUT', '180'))
+
+        # Latency histograms for every playback stage, optionally exported for Prometheus
+        self.metrics = PlaybackMetrics()
+        self.metrics_file = os.getenv('MUSIC_METRICS_FILE') or None
+
+        # Race the fallback resolvers instead of trying them one by one
+        self.hedge_enabled = os.getenv('MUSIC_HEDGED_RESOLUTION', '1') != '0'
+        self.hedge_delay = float(os.getenv('MUSIC_HEDGE_DELAY', '0.5'))
+
+        # Shared keep-alive HTTP session for the Piped/Invidious/YouTube fallbacks
+        self.http = HTTPClient(
+            connect_timeout=float(os.getenv('MUSIC_HTTP_CONNECT_TIMEOUT', '3')),
+            read_timeout=float(os.getenv('MUSIC_HTTP_READ_TIMEOUT', '7')),
+            total_timeout=float(os.getenv('MUSIC_HTTP_TOTAL_TIMEOUT', '10'))
+        )
+
+        # Ahead of any repeat filter, so suppressed reconnect records still count
+        self.voice_close_code_filter = VoiceCloseCodeFilter(self)
+        logging.getLogger('discord.voice_state').filters.insert(0, self.voice_close_code_filter)
 
     def __del__(self):
         # Clean up temporary cookie file if it exists
         if self.cookies_file and self.cookies_file.exists():
             self.cookies_file.unlink()
 
-    def cog_unload(self):
-        logging.getLogger('discord.voice_state').removeHandler(self.voice_diagnostic_handler)
+    async def cog_load(self):
+        await self.http.start()
+        asyncio.create_task(self.warm_ydl_pool())
+        self.save_instance_health.start()
+        self.reap_idle_players.start()
+        if self.metrics_file:
+            self.write_metrics.start()
+
+    async def cog_unload(self):
+        logging.getLogger('discord.voice_state').removeFilter(self.voice_close_code_filter)
+        self.save_instance_health.cancel()
+        self.reap_idle_players.cancel()
+        if self.metrics_file:
+            self.write_metrics.cancel()
+            await self.write_metrics()
+        for guild_id in list(self.players):
+            self.destroy_player(guild_id)
+        for task in list(self.loudness_jobs):
+            task.cancel()
+        self.instance_health.save()
+        self.resolver.shutdown()
+        if self.process_extractor:
+            self.process_extractor.shutdown()
+        await self.http.close()
+        self.stream_cache.close()
+        self.search_cache.close()
+        self.spotify_cache.close()
+        self.loudness_index.close()
+
+    async def warm_ydl_pool(self):
+        """Build every resolver worker's YoutubeDL ahead of the first request"""
+        started = time.perf_counter()
+        futures = self.resolver.prime(self.ydl_pool.warm, self.ydl_opts)
+        results = await asyncio.gather(*map(asyncio.wrap_future, futures), return_exceptions=True)
+        failed = [result for result in results if isinstance(result, BaseException)]
+        if failed:
+            logger.warning(f"Warming yt-dlp failed: {failed[0]}")
+        else:
+            logger.info(f"Warmed {len(futures)} yt-dlp instances in {time.perf_counter() - started:.2f}s")
+
+    @tasks.loop(minutes=5)
+    async def save_instance_health(self):
+        self.instance_health.save()
+
+    @tasks.loop(seconds=15)
+    async def reap_idle_players(self):
+        """Leave voice channels nobody is listening to and drop their guild state"""
+        now = time.monotonic()
+        for guild_id, player in list(self.players.items()):
+            vc = player.voice_client
+            if vc is None or not vc.is_connected():
+                # Never joined, or dropped without us noticing: keep it only while in use
+                if not player.busy and now - player.last_active >= self.idle_timeout:
+                    self.destroy_player(guild_id)
+                continue
+
+            if vc.is_playing() or (player.transition is not None and not player.transition.done()):
+                player.touch()
+
+            listeners = [member for member in getattr(vc.channel, 'members', []) if not member.bot]
+            if listeners:
+                player.alone_since = None
+            elif player.alone_since is None:
+                player.alone_since = now
+
+            if player.alone_since is not None and now - player.alone_since >= self.alone_timeout:
+                reason = "no listeners left"
+            elif vc.is_paused():
+                # A paused track is not idle, but is not kept forever either
+                if now - player.last_active < self.paused_timeout:
+                    continue
+                reason = f"paused for {format_duration(self.paused_timeout)}"
+            elif now - player.last_active >= self.idle_timeout:
+                reason = f"nothing played for {format_duration(self.idle_timeout)}"
+            else:
+                continue
+
+            logger.info(f"Leaving voice in guild {guild_id}: {reason}")
+            channel = player.channel
+            await self.disconnect_voice_client(guild_id, getattr(vc, 'guild', None))
+            if channel is not None:
+                try:
+                    await channel.send(f"👋 Left the voice channel: {reason}.")
+                except discord.HTTPException:
+                    pass
+
+    @tasks.loop(seconds=30)
+    async def write_metrics(self):
+        try:
+            self.metrics.write_textfile(self.metrics_file)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {self.metrics_file}: {str(e)}")
 
     def note_voice_close_code(self, code):
         self.last_voice_close_code = code
@@ -203,24 +410,43 @@ class Music(commands.Cog):
 
         return "❌ Não foi possível entrar no canal de voz."
 
+    def get_player(self, guild_id):
+        """Return the guild's player state, creating it on first use"""
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(guild_id)
+            player.task = asyncio.create_task(self.run_player(player))
+        player.touch()
+        return player
+
+    def destroy_player(self, guild_id):
+        """Drop all state kept for a guild and cancel its background work"""
+        self.resolver.cancel_guild(guild_id)
+        self.cancel_prefetch(guild_id)
+        player = self.players.pop(guild_id, None)
+        if player is not None:
+            self.cancel_transition(player)
+            if player.task is not None:
+                player.task.cancel()
+            player.clear()
+
+    def get_voice_client(self, ctx):
+        player = self.players.get(str(ctx.guild.id))
+        return ctx.guild.voice_client or (player.voice_client if player else None)
+
     async def disconnect_voice_client(self, guild_id, guild=None):
-        vc = self.voice_clients.get(guild_id)
+        player = self.players.get(guild_id)
+        vc = player.voice_client if player else None
         if vc is None and guild is not None:
             vc = guild.voice_client
 
-        if vc is None:
-            return
-
         try:
-            if vc.is_connected():
+            if vc is not None and vc.is_connected():
                 await vc.disconnect(force=True)
         except Exception:
             logger.exception("Failed to disconnect stale voice client for guild %s", guild_id)
         finally:
-            self.voice_clients.pop(guild_id, None)
-            self.current_urls.pop(guild_id, None)
-            self.loop_enabled.pop(guild_id, None)
-            self.skip_requested.discard(guild_id)
+            self.destroy_player(guild_id)
 
     async def ensure_voice_client(self, ctx):
         if not self.voice_library_supports_current_discord_protocol():
@@ -228,132 +454,215 @@ class Music(commands.Cog):
 
         guild_id = str(ctx.guild.id)
         channel = ctx.author.voice.channel
-        vc = ctx.guild.voice_client or self.voice_clients.get(guild_id)
+        vc = self.get_voice_client(ctx)
 
         if vc is not None and not vc.is_connected():
             await self.disconnect_voice_client(guild_id, ctx.guild)
             vc = None
 
         if vc is None:
-            vc = await channel.connect(timeout=8.0)
+            with self.metrics.stage('voice_connect'):
+                vc = await channel.connect(timeout=8.0)
         elif vc.channel != channel:
-            await vc.move_to(channel)
+            with self.metrics.stage('voice_connect'):
+                await vc.move_to(channel)
 
-        self.voice_clients[guild_id] = vc
+        self.get_player(guild_id).voice_client = vc
         return vc
 
+    async def join_author_channel(self, ctx):
+        """Join the command author's voice channel, reporting failures in chat"""
+        guild_id = str(ctx.guild.id)
+        try:
+            return await self.ensure_voice_client(ctx)
+        except discord.errors.ConnectionClosed:
+            await self.disconnect_voice_client(guild_id, ctx.guild)
+            await ctx.send(self.build_voice_connection_error())
+        except asyncio.TimeoutError:
+            await self.disconnect_voice_client(guild_id, ctx.guild)
+            await ctx.send(self.build_voice_connection_error())
+        except RuntimeError as e:
+            logger.error(f"Voice runtime error: {str(e)}")
+            await self.disconnect_voice_client(guild_id, ctx.guild)
+            await ctx.send(str(e))
+        except Exception as e:
+            logger.error(f"Voice connection error: {str(e)}")
+            await self.disconnect_voice_client(guild_id, ctx.guild)
+            await ctx.send(self.build_voice_connection_error())
+        return None
+
     @commands.Cog.listener()
     async def on_ready(self):
         print(f"{__name__} is online!")
 
-    async def play_next(self, ctx):
-        guild_id = str(ctx.guild.id)
-        if guild_id in self.skip_requested:
-            self.skip_requested.remove(guild_id)
-        elif self.loop_enabled.get(guild_id) and self.current_urls.get(guild_id):
-            await self.play_song(ctx, self.current_urls[guild_id])
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        await self.disconnect_voice_client(str(guild.id), guild)
+        self.metrics.forget_guild(str(guild.id))
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        # Kicked or disconnected from voice without going through %leave.
+        # discord.py's own reconnects also pass through channel=None, so
+        # only tear down once the voice client is really gone.
+        if member.id == self.bot.user.id and before.channel is not None and after.channel is None:
+            asyncio.create_task(self.forget_if_disconnected(member.guild))
+
+    async def forget_if_disconnected(self, guild):
+        """Drop a guild's player if the bot is still out of voice after a grace period"""
+        guild_id = str(guild.id)
+        player = self.players.get(guild_id)
+        if player is None:
             return
+        await asyncio.sleep(VOICE_GONE_GRACE)
+        # A reconnecting client stays registered on the guild until it gives up
+        if self.players.get(guild_id) is player and guild.voice_client is None:
+            self.destroy_player(guild_id)
+
+    async def run_player(self, player):
+        """Per-guild player task: the only place tracks are started
+
+        Commands and the audio thread post messages here instead of calling
+        into playback themselves, so a skip or stop can cancel a transition
+        that is still resolving.
+        """
+        while True:
+            kind, payload = await player.messages.get()
+            try:
+                if kind == FINISHED:
+                    # Ignore sources that were already skipped or stopped
+                    if payload is not player.source:
+                        continue
+                    player.source = None
+                    position = resume_position(player.current, payload, player.recoveries)
+                    if position is not None:
+                        player.transition = asyncio.create_task(
+                            self.resume_track(player, player.current, position)
+                        )
+                    else:
+                        self.begin_transition(player, replay=player.loop)
+                elif kind == ADVANCE:
+                    if not player.busy:
+                        self.begin_transition(player)
+                elif kind == SKIP:
+                    self.cancel_transition(player)
+                    self.stop_source(player)
+                    self.begin_transition(player)
+                elif kind == STOP:
+                    self.cancel_transition(player)
+                    self.resolver.cancel_guild(player.guild_id)
+                    self.cancel_prefetch(player.guild_id)
+                    self.stop_source(player)
+                    player.clear()
+            except Exception as e:
+                logger.error(f"Player error in guild {player.guild_id}: {str(e)}\n{traceback.format_exc()}")
+
+    async def resume_track(self, player, track, position):
+        """Reopen a track that stopped early, seeking to where it got to"""
+        player.recoveries += 1
+        logger.warning(
+            f"{track.display_title} stopped at {format_duration(position)} of "
+            f"{track.duration_string} in guild {player.guild_id}, resuming"
+        )
 
-        if guild_id in self.queue and self.queue[guild_id]:
-            # Get next song from queue
-            url = self.queue[guild_id].pop(0)
-            await self.play_song(ctx, url)
-
-    async def extract_youtube_id(self, url):
-        """Extract video ID from a YouTube URL"""
-        # Direct match for watch?v= parameter (most common)
-        watch_v_match = re.search(r'(?:youtube\.com\/watch\?v=|youtube\.com\/watch\?.+&v=)([a-zA-Z0-9_-]{11})', url)
-        if watch_v_match:
-            return watch_v_match.group(1)
-            
-        # Extended regex to handle more YouTube URL formats
-        youtube_regex = r'(?:youtube\.com\/(?:[^\/\n\s]+\/\S+\/|(?:v|e(?:mbed)?)\/|\S*?[?&]v=)|(?:youtu\.be|music\.youtube\.com)\/([a-zA-Z0-9_-]{11}))'
-        match = re.search(youtube_regex, url)
-        
-        if match:
-            return match.group(1)
-        
-        # Additional checks for other URL formats
-        if 'youtube.com' in url or 'youtu.be' in url or 'music.youtube.com' in url:
-            # Check for v= parameter
-            v_param = re.search(r'[?&]v=([a-zA-Z0-9_-]{11})', url)
-            if v_param:
-                return v_param.group(1)
-                
-            # Check for youtu.be/ format
-            short_url = re.search(r'youtu\.be\/([a-zA-Z0-9_-]{11})', url)
-            if short_url:
-                return short_url.group(1)
-                
-            # Check for music.youtube.com
-            music_url = re.search(r'music\.youtube\.com\/watch\?v=([a-zA-Z0-9_-]{11})', url)
-            if music_url:
-                return music_url.group(1)
-                
-            # Check for embed format
-            embed_url = re.search(r'youtube\.com\/embed\/([a-zA-Z0-9_-]{11})', url)
-            if embed_url:
-                return embed_url.group(1)
-        
-        # Fallback: try to find any 11-character ID in the URL that looks like a YouTube ID
-        potential_ids = re.findall(r'([a-zA-Z0-9_-]{11})', url)
-        for potential_id in potential_ids:
-            if re.match(r'^[a-zA-Z0-9_-]{11}$', potential_id):
-                return potential_id
-                
-        return None
+        # discord.py reconnects voice on its own; give it a moment
+        vc = player.voice_client
+        for _ in range(20):
+            if vc is not None and vc.is_connected():
+                break
+            await asyncio.sleep(0.5)
+        else:
+            player.current = None
+            player.track_started = None
+            return
 
-    async def is_youtube_url(self, url):
-        """Check if a URL is a YouTube URL"""
-        # First check with basic domain matching
-        youtube_domains = [
-            'youtube.com', 
-            'youtu.be', 
-            'www.youtube.com', 
-            'm.youtube.com',
-            'music.youtube.com',
-            'youtube-nocookie.com'
-        ]
-        
-        for domain in youtube_domains:
-            if domain in url:
-                return True
-        
-        # Second, try pattern matching for YouTube URLs
-        youtube_patterns = [
-            r'(?:https?://)?(?:www\.)?youtube\.com/watch\?(?:.*&)?v=[\w-]+(?:&.*)?',
-            r'(?:https?://)?(?:www\.)?youtu\.be/[\w-]+(?:\?.*)?',
-            r'(?:https?://)?(?:www\.)?youtube\.com/embed/[\w-]+(?:\?.*)?',
-            r'(?:https?://)?(?:www\.)?youtube\.com/v/[\w-]+(?:\?.*)?',
-            r'(?:https?://)?(?:www\.)?youtube\.com/user/[\w-]+(?:/.*)?',
-            r'(?:https?://)?(?:www\.)?youtube\.com/channel/[\w-]+(?:/.*)?',
-            r'(?:https?://)?(?:www\.)?music\.youtube\.com/watch\?(?:.*&)?v=[\w-]+(?:&.*)?'
-        ]
-        
-        for pattern in youtube_patterns:
-            if re.match(pattern, url, re.IGNORECASE):
-                return True
-                
-        return False
-
-    async def get_cached_stream(self, video_id):
-        """Get stream URL from cache if available and not expired"""
-        if video_id in self.stream_cache:
-            cache_data = self.stream_cache[video_id]
-            if time.time() - cache_data['timestamp'] < self.cache_timeout:
-                return cache_data['url']
-        return None
+        # The stream URL is the usual culprit, so never reuse it
+        if not track.is_local:
+            await self.forget_stream(track, player.guild_id)
+
+        await self.play_song(player, track, start_at=position, resuming=True)
+        if player.source is None:
+            await self.play_next(player)
+
+    def begin_transition(self, player, replay=False):
+        player.transition = asyncio.create_task(self.play_next(player, replay))
+
+    def cancel_transition(self, player):
+        # Foreground jobs only: prefetch keeps running for the tracks after it
+        self.resolver.cancel_guild(player.guild_id, include_background=False)
+        if player.transition is not None and not player.transition.done():
+            player.transition.cancel()
+        player.transition = None
+
+    def stop_source(self, player):
+        """Stop the voice client without its FINISHED message starting a track"""
+        player.source = None
+        vc = player.voice_client
+        if vc is not None and (vc.is_playing() or vc.is_paused()):
+            vc.stop()
+
+    async def play_next(self, player, replay=False):
+        """Start the next playable track (or the current one again when looping)"""
+        track = player.current if replay and player.current else player.next_track()
+        while track is not None:
+            await self.play_song(player, track)
+            if player.source is not None:
+                return
+            # Could not be played: move on instead of stalling the queue
+            track = player.next_track()
+
+        # Nothing left: keep the connection but not the finished track
+        player.current = None
+        player.track_started = None
+
+    def _match_extractor(self, url):
+        """Find the yt-dlp extractor and media id for a URL without any network I/O"""
+        if self._extractor_classes is None:
+            self._extractor_classes = [
+                ie for ie in yt_dlp.extractor.gen_extractor_classes() if ie.ie_key() != 'Generic'
+            ]
 
-    async def cache_stream(self, video_id, stream_url):
-        """Cache stream URL with timestamp"""
-        if not self.is_valid_stream_url(stream_url):
-            logger.warning(f"Refusing to cache invalid stream URL for video {video_id}")
+        for ie in self._extractor_classes:
+            if ie.suitable(url):
+                return ie.ie_key().lower(), ie.get_temp_id(url)
+        return 'generic', None
+
+    async def media_cache_key(self, url, guild_id=None):
+        """Cache key (extractor:id) for a URL, derived from the URL alone"""
+        route = classify(url)
+        if route.video_id:
+            return f"youtube:{route.video_id}"
+
+        # Matching against every extractor pattern is CPU work, keep it off the loop
+        extractor, media_id = await self.resolver.run(
+            self._match_extractor, route.query, guild_id=guild_id, label=f"match {url}"
+        )
+        # Fall back to the URL itself, minus query string and fragment
+        return f"{extractor}:{media_id or route.key}"
+
+    async def forget_stream(self, track, guild_id):
+        """Drop a track's stream URL and its stream cache entry after the URL failed"""
+        track.clear_stream()
+        try:
+            cache_key = await self.media_cache_key(track.webpage_url, guild_id)
+        except ResolverCancelled:
+            raise
+        except Exception as e:
+            logger.warning(f"Could not evict the cached stream of {track.webpage_url}: {str(e)}")
             return
+        self.stream_cache.delete(cache_key)
 
-        self.stream_cache[video_id] = {
-            'url': stream_url,
-            'timestamp': time.time()
-        }
+    async def get_cached_stream(self, cache_key):
+        """Get stream data from cache if available and not expired"""
+        return self.stream_cache.get_stream(cache_key)
+
+    async def cache_stream(self, cache_key, stream_data):
+        """Cache stream data until the URL's own expiry"""
+        if not self.is_valid_stream_url(stream_data.get('url')):
+            logger.warning(f"Refusing to cache invalid stream URL for {cache_key}")
+            return
+
+        self.stream_cache.put_stream(cache_key, stream_data)
 
     def is_valid_stream_url(self, stream_url):
         """Return True when a stream URL is non-empty and has a usable shape."""
@@ -390,12 +699,82 @@ class Music(commands.Cog):
 
     def find_downloaded_audio(self, video_id):
         """Find a downloaded audio file for a video ID regardless of final extension."""
-        candidates = sorted(
-            self.cache_dir.glob(f"{video_id}.*"),
-            key=lambda path: path.stat().st_mtime,
-            reverse=True
+        return self.audio_cache.lookup(video_id)
+
+    def _extract_info(self, url, opts=None, download=False):
+        """Blocking yt-dlp extraction. Only ever called on a resolver worker."""
+        opts = opts or self.ydl_opts
+        if self.process_extractor and self.process_extractor.supports(opts, download):
+            # The resolver thread just waits, so scheduling and timeouts work as before
+            return self.process_extractor.extract(url, opts, timeout=self.resolver.timeout)
+        with self.ydl_pool.instance(opts) as ydl:
+            return ydl.extract_info(url, download=download)
+
+    async def extract_info(self, url, *, guild_id=None, opts=None, download=False, timeout=None,
+                           background=False, priority=None):
+        """Run a yt-dlp extraction on the resolver pool without blocking the loop."""
+        return await self.resolver.run(
+            self._extract_info, url, opts, download,
+            guild_id=guild_id,
+            timeout=timeout,
+            label=f"{'download' if download else 'extract'} {url}",
+            background=background,
+            priority=priority
         )
-        return candidates[0] if candidates else None
+
+    async def download_audio(self, video_id, url, guild_id=None):
+        """Download a track into the audio cache and return (info, path).
+
+        A file that is already cached is returned without downloading, and
+        concurrent requests for the same id wait for a single download.
+        """
+        lock = self.audio_cache.download_lock(video_id)
+        try:
+            async with lock:
+                cached_path = self.find_downloaded_audio(video_id)
+                if cached_path:
+                    return {}, cached_path
+
+                download_opts = self.ydl_opts.copy()
+                download_opts['format'] = 'bestaudio[acodec=opus]/bestaudio/best'
+                download_opts['outtmpl'] = self.audio_cache.incoming_template(video_id)
+                # Lets a skip or leave abort the download between fragments
+                download_opts['progress_hooks'] = [lambda _: check_cancelled()]
+
+                try:
+                    info = await self.extract_info(
+                        url,
+                        guild_id=guild_id,
+                        opts=download_opts,
+                        download=True,
+                        timeout=self.download_timeout
+                    )
+                except BaseException:
+                    self.audio_cache.discard(download_opts['outtmpl'])
+                    raise
+
+                return info, self.audio_cache.commit(video_id, download_opts['outtmpl'])
+        finally:
+            self.audio_cache.release_lock(video_id)
+
+    def create_audio_source(self, stream_data, start_at=0.0, gain_db=0.0):
+        """Build the FFmpeg source for resolved stream data.
+
+        Cached Opus files are passed through with codec copy, so playing them
+        costs no decode or encode; everything else is transcoded to Opus.
+        ``start_at`` seeks the input, which for remote streams is a range
+        request rather than reading up to that point. ``gain_db`` adds a
+        volume filter, which a cached file can only get by being transcoded;
+        corrections within MUSIC_LOUDNESS_COPY_TOLERANCE are skipped for
+        cached files so they keep the near-zero CPU copy path.
+        """
+        if (stream_data.get('is_local', False) and abs(gain_db) <= self.loudness_copy_tolerance
+                and Path(stream_data['url']).suffix in ('.opus', '.ogg')):
+            return discord.FFmpegOpusAudio(
+                stream_data['url'], codec='copy', **seek_options(self.FFMPEG_COPY_OPTIONS, start_at)
+            )
+        options = with_gain(self.FFMPEG_OPTIONS, gain_db)
+        return discord.FFmpegOpusAudio(stream_data['url'], **seek_options(options, start_at))
 
     async def get_direct_stream(self, video_id):
         """Get stream URL directly from YouTube frontend"""
@@ -411,104 +790,124 @@ class Music(commands.Cog):
             
             # Try to get stream URL from YouTube directly
             url = f"https://www.youtube.com/watch?v={video_id}"
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        html = await response.text()
-                        
-                        # Extract player response
-                        player_response = re.search(r'ytInitialPlayerResponse\s*=\s*({.+?});', html)
-                        if player_response:
-                            data = json.loads(player_response.group(1))
-                            
-                            # Try to find audio stream URL
-                            formats = data.get('streamingData', {}).get('adaptiveFormats', [])
-                            for fmt in formats:
-                                stream_url = fmt.get('url')
-                                if fmt.get('mimeType', '').startswith('audio/') and self.is_valid_stream_url(stream_url):
-                                    return self.normalize_stream_data({
-                                        'url': fmt.get('url', ''),
-                                        'title': data.get('videoDetails', {}).get('title', 'Unknown Title')
-                                    })
+            response = await self.http.get(url, headers=headers)
+            if response.status == 200:
+                html = response.text
+                
+                # Extract player response
+                player_response = re.search(r'ytInitialPlayerResponse\s*=\s*({.+?});', html)
+                if player_response:
+                    data = json.loads(player_response.group(1))
+                    
+                    # Try to find audio stream URL
+                    formats = data.get('streamingData', {}).get('adaptiveFormats', [])
+                    for fmt in formats:
+                        stream_url = fmt.get('url')
+                        if fmt.get('mimeType', '').startswith('audio/') and self.is_valid_stream_url(stream_url):
+                            return self.normalize_stream_data({
+                                'url': fmt.get('url', ''),
+                                'title': data.get('videoDetails', {}).get('title', 'Unknown Title')
+                            })
             
             return None
         except Exception as e:
             print(f"Direct stream error: {str(e)}")
             return None
 
+    async def fetch_piped_stream(self, instance, video_id):
+        """Ask a single Piped instance for a stream"""
+        api_url = f"{instance}/streams/{video_id}"
+        data = mirror_payload(await self.http.get(api_url))
+        if data is not None:
+            title = data.get('title', 'Unknown Title')
+            
+            # First try to get audio streams
+            if 'audioStreams' in data and data['audioStreams']:
+                for stream in data['audioStreams']:
+                    stream_data = self.normalize_stream_data({
+                        'url': stream.get('url'),
+                        'title': title
+                    })
+                    if stream_data:
+                        return stream_data
+            
+            # If no audio streams, try video streams
+            if 'videoStreams' in data and data['videoStreams']:
+                stream_data = self.normalize_stream_data({
+                    'url': data['videoStreams'][0].get('url'),
+                    'title': title
+                })
+                if stream_data:
+                    return stream_data
+                
+        return None
+
     async def get_piped_stream(self, video_id):
         """Get stream URL from Piped API"""
-        # Try each Piped instance
-        random.shuffle(self.piped_instances)  # Randomize to distribute load
-        
-        for instance in self.piped_instances:
+        # Try each Piped instance, healthiest first
+        for instance in self.instance_health.ordered('piped'):
+            started = time.monotonic()
             try:
-                api_url = f"{instance}/streams/{video_id}"
-                response = requests.get(api_url, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    title = data.get('title', 'Unknown Title')
-                    
-                    # First try to get audio streams
-                    if 'audioStreams' in data and data['audioStreams']:
-                        for stream in data['audioStreams']:
-                            stream_data = self.normalize_stream_data({
-                                'url': stream.get('url'),
-                                'title': title
-                            })
-                            if stream_data:
-                                return stream_data
-                    
-                    # If no audio streams, try video streams
-                    if 'videoStreams' in data and data['videoStreams']:
-                        stream_data = self.normalize_stream_data({
-                            'url': data['videoStreams'][0].get('url'),
-                            'title': title
-                        })
-                        if stream_data:
-                            return stream_data
+                stream_data = await self.fetch_piped_stream(instance, video_id)
             except Exception as e:
+                # Transport errors, timeouts, 5xx and malformed payloads
                 print(f"Error with Piped instance {instance}: {str(e)}")
+                self.instance_health.record_failure(instance, time.monotonic() - started)
                 continue
+
+            # "No usable stream for this video" still means the mirror works
+            self.instance_health.record_success(instance, time.monotonic() - started)
+            if stream_data:
+                return stream_data
+                
+        return None
+
+    async def fetch_invidious_stream(self, instance, video_id):
+        """Ask a single Invidious instance for a stream"""
+        api_url = f"{instance}/api/v1/videos/{video_id}"
+        data = mirror_payload(await self.http.get(api_url))
+        if data is not None:
+            title = data.get('title', 'Unknown Title')
+            
+            # Get audio formats
+            formats = data.get('adaptiveFormats', [])
+            for fmt in formats:
+                if fmt.get('type', '').startswith('audio/'):
+                    stream_data = self.normalize_stream_data({
+                        'url': fmt.get('url'),
+                        'title': title
+                    })
+                    if stream_data:
+                        return stream_data
+            
+            # Fallback to any format with a URL
+            if formats and 'url' in formats[0]:
+                stream_data = self.normalize_stream_data({
+                    'url': formats[0]['url'],
+                    'title': title
+                })
+                if stream_data:
+                    return stream_data
                 
         return None
 
     async def get_invidious_stream(self, video_id):
         """Get stream URL from Invidious API"""
-        random.shuffle(self.invidious_instances)  # Randomize to distribute load
-        
-        for instance in self.invidious_instances:
+        # Try each Invidious instance, healthiest first
+        for instance in self.instance_health.ordered('invidious'):
+            started = time.monotonic()
             try:
-                api_url = f"{instance}/api/v1/videos/{video_id}"
-                response = requests.get(api_url, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    title = data.get('title', 'Unknown Title')
-                    
-                    # Get audio formats
-                    formats = data.get('adaptiveFormats', [])
-                    for fmt in formats:
-                        if fmt.get('type', '').startswith('audio/'):
-                            stream_data = self.normalize_stream_data({
-                                'url': fmt.get('url'),
-                                'title': title
-                            })
-                            if stream_data:
-                                return stream_data
-                    
-                    # Fallback to any format with a URL
-                    if formats and 'url' in formats[0]:
-                        stream_data = self.normalize_stream_data({
-                            'url': formats[0]['url'],
-                            'title': title
-                        })
-                        if stream_data:
-                            return stream_data
+                stream_data = await self.fetch_invidious_stream(instance, video_id)
             except Exception as e:
+                # Transport errors, timeouts, 5xx and malformed payloads
                 print(f"Error with Invidious instance {instance}: {str(e)}")
+                self.instance_health.record_failure(instance, time.monotonic() - started)
                 continue
+
+            # "No usable stream for this video" still means the mirror works
+            self.instance_health.record_success(instance, time.monotonic() - started)
+            if stream_data:
+                return stream_data
                 
         return None
 
@@ -532,8 +931,8 @@ class Music(commands.Cog):
             
             for src in stream_sources:
                 try:
-                    response = requests.get(src, headers=headers, timeout=10)
-                    if response.status_code == 200:
+                    response = await self.http.get(src, headers=headers)
+                    if response.status == 200:
                         content_type = response.headers.get('Content-Type', '')
                         if 'application/json' in content_type:
                             data = response.json()
@@ -566,6 +965,32 @@ class Music(commands.Cog):
             print(f"Error with YT Music API: {str(e)}")
             return None
 
+    def stream_resolvers(self, video_id):
+        """Alternative stream resolvers, in the order they are tried or hedged"""
+        return [
+            ('piped', lambda: self.get_piped_stream(video_id)),
+            ('invidious', lambda: self.get_invidious_stream(video_id)),
+            ('direct', lambda: self.get_direct_stream(video_id)),
+            ('ytmusic', lambda: self.get_ytmusic_stream(video_id)),
+        ]
+
+    async def get_hedged_stream(self, video_id):
+        """Race the alternative resolvers and keep the first valid stream"""
+        source, stream_data, elapsed = await hedged_race(
+            self.stream_resolvers(video_id),
+            self.normalize_stream_data,
+            hedge_delay=self.hedge_delay
+        )
+
+        if not stream_data:
+            logger.warning(f"Hedged resolution failed for {video_id} after {elapsed:.2f}s")
+            return None
+
+        logger.info(f"Hedged resolution for {video_id} won by {source} in {elapsed:.2f}s")
+        stream_data['source'] = source
+        stream_data['resolve_time'] = elapsed
+        return stream_data
+
     async def direct_search(self, query):
         """Search directly from YouTube's frontend and get results"""
         try:
@@ -576,39 +1001,36 @@ class Music(commands.Cog):
                 'Accept-Language': 'en-US,en;q=0.9'
             }
             
-            session = aiohttp.ClientSession()
-            async with session.get(search_url, headers=headers) as response:
-                if response.status == 200:
-                    html = await response.text()
-                    
-                    # Extract video IDs from the page
-                    video_ids = re.findall(r'watch\?v=([a-zA-Z0-9_-]{11})', html)
-                    unique_ids = []
-                    for vid_id in video_ids:
-                        if vid_id not in unique_ids:
-                            unique_ids.append(vid_id)
-                    
-                    # Limit to 10 results
-                    limited_ids = unique_ids[:10]
-                    
-                    # Format results
-                    formatted_results = []
-                    for vid_id in limited_ids:
-                        # Extract title from page if possible
-                        title_match = re.search(r'title="([^"]+)".*?watch\?v=' + vid_id, html)
-                        title = title_match.group(1) if title_match else f"YouTube Video ({vid_id})"
-                        
-                        formatted_results.append({
-                            'id': vid_id,
-                            'title': title,
-                            'duration_string': 'Unknown',
-                            'webpage_url': f"https://www.youtube.com/watch?v={vid_id}"
-                        })
+            response = await self.http.get(search_url, headers=headers)
+            if response.status == 200:
+                html = response.text
+                
+                # Extract video IDs from the page
+                video_ids = re.findall(r'watch\?v=([a-zA-Z0-9_-]{11})', html)
+                unique_ids = []
+                for vid_id in video_ids:
+                    if vid_id not in unique_ids:
+                        unique_ids.append(vid_id)
+                
+                # Limit to 10 results
+                limited_ids = unique_ids[:10]
+                
+                # Format results
+                formatted_results = []
+                for vid_id in limited_ids:
+                    # Extract title from page if possible
+                    title_match = re.search(r'title="([^"]+)".*?watch\?v=' + vid_id, html)
+                    title = title_match.group(1) if title_match else f"YouTube Video ({vid_id})"
                     
-                    await session.close()
-                    return formatted_results
+                    formatted_results.append({
+                        'id': vid_id,
+                        'title': title,
+                        'duration_string': 'Unknown',
+                        'webpage_url': f"https://www.youtube.com/watch?v={vid_id}"
+                    })
+                
+                return formatted_results
             
-            await session.close()
             return []
         except Exception as e:
             print(f"Direct search error: {str(e)}")
@@ -642,199 +1064,627 @@ class Music(commands.Cog):
             print(f"Error updating cookies: {e}")
             return False
 
-    async def play_song(self, ctx, url):
-        """Play a song using multiple fallback methods"""
+    async def enqueue_playlist(self, ctx, url, video_id=None, requested_at=None):
+        """Queue every entry of a playlist from a single flat extraction
+
+        Entries keep only the title and duration the playlist page already
+        lists; their streams are resolved by the prefetcher as they near the
+        head of the queue, so large playlists are queued almost instantly.
+        """
+        guild_id = str(ctx.guild.id)
+        await ctx.send("📃 Loading playlist...")
+        title, tracks = await self.load_playlist(url, guild_id, video_id)
+        if not tracks:
+            await ctx.send("❌ No playable tracks found in this playlist.")
+            return
+
+        player = self.get_player(guild_id)
+        if not player.busy and not player.queue:
+            tracks[0].requested_at = requested_at
+        player.queue.extend(tracks)
+        await ctx.send(f"📃 Added **{len(tracks)}** tracks from **{title or 'playlist'}** to the queue.")
+
+        self.schedule_prefetch(guild_id)
+        player.post(ADVANCE)
+
+    async def load_playlist(self, url, guild_id, video_id=None):
+        """Flat-extract a playlist into its title and one unresolved track per playable entry
+
+        Links shared from inside a playlist or mix (watch?v=X&list=Y) start
+        the queue at the linked video rather than at the top of the list.
+        """
+        playlist_opts = self.ydl_opts.copy()
+        playlist_opts['extract_flat'] = True
+        playlist_opts['noplaylist'] = False
+        playlist_opts['playlistend'] = self.playlist_limit
+
+        info = await self.extract_info(url, guild_id=guild_id, opts=playlist_opts)
+        tracks = [
+            Track.from_playlist_entry(entry)
+            for entry in (info or {}).get('entries') or []
+            if entry and (entry.get('id') or entry.get('url'))
+            and entry.get('title') not in ('[Private video]', '[Deleted video]')
+        ]
+        if video_id:
+            start = next((i for i, track in enumerate(tracks) if track.video_id == video_id), None)
+            if start is not None:
+                tracks = tracks[start:]
+            else:
+                # Past playlistend, or not listed at all: still play what was linked first
+                tracks.insert(0, Track(
+                    f"https://www.youtube.com/watch?v={video_id}", video_id=video_id, extractor='youtube'
+                ))
+        return (info or {}).get('title'), tracks
+
+    async def resolve_track(self, track, guild_id=None):
+        """Resolve a track's metadata and stream URL once, when it is queued"""
         try:
-            # First determine if this is a YouTube URL
-            is_youtube = await self.is_youtube_url(url)
-            
-            if is_youtube:
-                # Extract the YouTube video ID
-                video_id = await self.extract_youtube_id(url)
-                if not video_id:
-                    await ctx.send("❌ Invalid YouTube URL format.")
-                    logger.error(f"Could not extract video ID from URL: {url}")
-                    return
-                
-                logger.info(f"Processing YouTube URL: {url}, Video ID: {video_id}")
-                
-                # Check cache first
-                cached_url = await self.get_cached_stream(video_id)
-                if self.is_valid_stream_url(cached_url):
-                    stream_data = {'url': cached_url, 'title': self.current_songs.get(str(ctx.guild.id), 'Cached Song')}
-                else:
-                    if cached_url:
-                        logger.warning(f"Dropping invalid cached stream URL for video {video_id}")
-                        self.stream_cache.pop(video_id, None)
+            info = await self.extract_info(
+                track.webpage_url, guild_id=guild_id, background=True, priority=PRIORITY_WARM
+            )
+            if info:
+                track.update_from_info(info)
+                if self.is_valid_stream_url(track.stream_url):
+                    await self.cache_stream(await self.media_cache_key(track.webpage_url, guild_id), {
+                        'url': track.stream_url,
+                        'title': track.title,
+                        'duration': track.duration
+                    })
+        except ResolverCancelled:
+            raise
+        except SchedulerSaturated:
+            pass  # Warming is best effort; prefetch resolves it later
+        except Exception as e:
+            # play_song still has the fallback resolvers when its turn comes
+            logger.warning(f"Could not resolve {track.webpage_url} when queueing: {str(e)}")
+        return track
+
+    async def resolve_stream(self, track, guild_id, notify=None, allow_download=True, background=False):
+        """Find a playable stream for a track using multiple fallback methods
+
+        Returns normalized stream data, or None if every method failed.
+        ``notify`` receives progress messages for the user; background
+        callers such as the prefetcher leave it unset.
+        """
+        async def say(message):
+            if notify is not None:
+                await notify(message)
+
+        url = track.webpage_url
+
+        # YouTube videos get the fallback resolvers, everything else goes to yt-dlp
+        video_id = classify(url).video_id
+        is_youtube = video_id is not None
+
+        if is_youtube:
+            track.video_id = video_id
+            track.extractor = 'youtube'
+            normalized_url = f"https://www.youtube.com/watch?v={video_id}"
+            logger.info(f"Processing YouTube URL: {url}, Video ID: {video_id}")
+
+        if track.stream_valid() and self.is_valid_stream_url(track.stream_url):
+            # Resolved when the track was queued, prefetched, or on a previous loop
+            return self.normalize_stream_data(
+                {'url': track.stream_url, 'title': track.display_title, 'is_local': track.is_local,
+                 'source': 'prefetched'},
+                is_local=track.is_local
+            )
 
-                    await ctx.send("🔍 Getting stream...")
-                    
-                    # Try each method in sequence
-                    stream_data = None
-                    normalized_url = f"https://www.youtube.com/watch?v={video_id}"
-                    
+        if not is_youtube:
+            # For non-YouTube URLs (SoundCloud, Bandcamp, ...), still cached per extractor:id
+            cache_key = await self.media_cache_key(url, guild_id)
+            with self.metrics.stage('cache_lookup'):
+                cached = await self.get_cached_stream(cache_key)
+            if cached and self.is_valid_stream_url(cached.get('url')):
+                cached['source'] = 'stream_cache'
+                return self.normalize_stream_data(cached)
+
+            try:
+                with self.metrics.stage('ytdlp_extract'):
+                    info = await self.extract_info(url, guild_id=guild_id, background=background)
+                if not info or 'url' not in info:
+                    await say("❌ Unable to process this URL.")
+                    return None
+                
+                stream_data = self.normalize_stream_data({
+                    'url': info['url'],
+                    'title': info.get('title', 'Unknown Title'),
+                    'duration': info.get('duration'),
+                    'is_local': False,
+                    'source': 'ytdlp'
+                })
+                if not stream_data:
+                    await say("❌ Unable to process this URL.")
+                    return None
+                await self.cache_stream(cache_key, stream_data)
+                return stream_data
+            except ResolverCancelled:
+                raise
+            except Exception as e:
+                logger.error(f"Non-YouTube URL processing error: {str(e)}")
+                await say("❌ Unable to process this URL.")
+                return None
+
+        # A previously downloaded copy needs no network at all
+        downloaded_path = self.find_downloaded_audio(video_id)
+        if downloaded_path:
+            return self.normalize_stream_data({
+                'url': str(downloaded_path),
+                'title': track.title or 'Cached Song',
+                'is_local': True,
+                'source': 'audio_cache'
+            }, is_local=True)
+
+        # Check cache first
+        cache_key = f"youtube:{video_id}"
+        with self.metrics.stage('cache_lookup'):
+            cached = await self.get_cached_stream(cache_key)
+        if cached and self.is_valid_stream_url(cached.get('url')):
+            cached['title'] = track.title or cached.get('title') or 'Cached Song'
+            cached['source'] = 'stream_cache'
+            return self.normalize_stream_data(cached)
+
+        if cached:
+            logger.warning(f"Dropping invalid cached stream URL for video {video_id}")
+            self.stream_cache.delete(cache_key)
+
+        await say("🔍 Getting stream...")
+        
+        # Try each method in sequence
+        stream_data = None
+        
+        try:
+            with self.metrics.stage('ytdlp_extract'):
+                info = await self.extract_info(normalized_url, guild_id=guild_id, background=background)
+            if info and info.get('url'):
+                stream_data = self.normalize_stream_data({
+                    'url': info['url'],
+                    'title': info.get('title', 'Unknown Title'),
+                    'duration': info.get('duration'),
+                    'source': 'ytdlp'
+                })
+        except ResolverCancelled:
+            raise
+        except Exception as e:
+            logger.error(f"yt-dlp error: {str(e)}")
+            if "Sign in to confirm you're not a bot" in str(e):
+                await say("⚠️ Refreshing connection...")
+                if await self.update_cookies():
                     try:
-                        with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                            info = ydl.extract_info(normalized_url, download=False)
-                            if info and info.get('url'):
+                        with self.metrics.stage('ytdlp_extract'):
+                            info = await self.extract_info(normalized_url, guild_id=guild_id, background=background)
+                        if info and info.get('url'):
+                            stream_data = self.normalize_stream_data({
+                                'url': info['url'],
+                                'title': info.get('title', 'Unknown Title'),
+                                'duration': info.get('duration'),
+                                'source': 'ytdlp'
+                            })
+                    except ResolverCancelled:
+                        raise
+                    except Exception as retry_error:
+                        logger.error(f"Retry failed: {str(retry_error)}")
+        
+        # Try alternative methods if main method fails
+        if not stream_data:
+            methods = range(1, 6 if allow_download else 5)  # Try up to 5 alternative methods
+            if self.hedge_enabled:
+                await say("⏳ Trying alternative sources...")
+                with self.metrics.stage('hedged_fallbacks'):
+                    stream_data = await self.get_hedged_stream(video_id)
+                # Downloading is too expensive to race, so it stays a last resort
+                methods = [5] if not stream_data and allow_download else []
+
+            method_names = {1: 'piped', 2: 'invidious', 3: 'direct', 4: 'ytmusic', 5: 'download'}
+            for method in methods:
+                try:
+                    with self.metrics.stage(f"fallback_{method_names[method]}"):
+                        if method == 1:
+                            stream_data = await self.get_piped_stream(video_id)
+                        elif method == 2:
+                            stream_data = await self.get_invidious_stream(video_id)
+                        elif method == 3:
+                            stream_data = await self.get_direct_stream(video_id)
+                        elif method == 4:
+                            stream_data = await self.get_ytmusic_stream(video_id)
+                        elif method == 5:
+                            # Try downloading as last resort
+                            info, downloaded_path = await self.download_audio(
+                                video_id, normalized_url, guild_id
+                            )
+                            if downloaded_path:
                                 stream_data = self.normalize_stream_data({
-                                    'url': info['url'],
-                                    'title': info.get('title', 'Unknown Title')
-                                })
-                    except Exception as e:
-                        logger.error(f"yt-dlp error: {str(e)}")
-                        if "Sign in to confirm you're not a bot" in str(e):
-                            await ctx.send("⚠️ Refreshing connection...")
-                            if await self.update_cookies():
-                                try:
-                                    with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                                        info = ydl.extract_info(normalized_url, download=False)
-                                        if info and info.get('url'):
-                                            stream_data = self.normalize_stream_data({
-                                                'url': info['url'],
-                                                'title': info.get('title', 'Unknown Title')
-                                            })
-                                except Exception as retry_error:
-                                    logger.error(f"Retry failed: {str(retry_error)}")
+                                    'url': str(downloaded_path),
+                                    'title': info.get('title') or track.title or "Downloaded Song",
+                                    'is_local': True
+                                }, is_local=True)
+
+                    if stream_data:
+                        stream_data.setdefault('source', method_names[method])
+                        break
                     
-                    # Try alternative methods if main method fails
-                    if not stream_data:
-                        for method in range(1, 6):  # Try up to 5 alternative methods
-                            try:
-                                if method == 1:
-                                    stream_data = await self.get_piped_stream(video_id)
-                                elif method == 2:
-                                    stream_data = await self.get_invidious_stream(video_id)
-                                elif method == 3:
-                                    stream_data = await self.get_direct_stream(video_id)
-                                elif method == 4:
-                                    stream_data = await self.get_ytmusic_stream(video_id)
-                                elif method == 5:
-                                    # Try downloading as last resort
-                                    output_path = self.cache_dir / f"{video_id}.mp3"
-                                    if not output_path.exists():
-                                        download_opts = self.ydl_opts.copy()
-                                        download_opts['outtmpl'] = str(self.cache_dir / f"{video_id}.%(ext)s")
-                                        with yt_dlp.YoutubeDL(download_opts) as ydl:
-                                            info = ydl.extract_info(normalized_url, download=True)
-                                            downloaded_path = self.find_downloaded_audio(video_id)
-                                            stream_data = self.normalize_stream_data({
-                                                'url': str(downloaded_path or output_path),
-                                                'title': info.get('title', f"Downloaded Song"),
-                                                'is_local': True
-                                            }, is_local=True)
-                                
-                                if stream_data:
-                                    break
-                                
-                                await ctx.send("⏳ Trying alternative source...")
-                                
-                            except Exception as e:
-                                logger.error(f"Alternative method {method} failed: {str(e)}")
-                                continue
-                    
-                    stream_data = self.normalize_stream_data(stream_data)
-
-                    if not stream_data:
-                        await ctx.send("❌ Unable to play this track. Please try another.")
-                        return
+                    await say("⏳ Trying alternative source...")
                     
-                    # Cache successful stream URL if it's not a local file
-                    if not stream_data.get('is_local', False):
-                        await self.cache_stream(video_id, stream_data['url'])
-                
-            else:
-                # For non-YouTube URLs
-                try:
-                    with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                        info = ydl.extract_info(url, download=False)
-                        if not info or 'url' not in info:
-                            await ctx.send("❌ Unable to process this URL.")
-                            return
-                        
-                        stream_data = self.normalize_stream_data({
-                            'url': info['url'],
-                            'title': info.get('title', 'Unknown Title'),
-                            'is_local': False
-                        })
-                        if not stream_data:
-                            await ctx.send("❌ Unable to process this URL.")
-                            return
+                except ResolverCancelled:
+                    raise
                 except Exception as e:
-                    logger.error(f"Non-YouTube URL processing error: {str(e)}")
-                    await ctx.send("❌ Unable to process this URL.")
-                    return
-            
-            # Create audio source and play
-            try:
-                stream_data = self.normalize_stream_data(
-                    stream_data,
-                    is_local=stream_data.get('is_local', False)
-                )
-                if not stream_data:
-                    await ctx.send("❌ Unable to play this track.")
-                    return
+                    logger.error(f"Alternative method {method} failed: {str(e)}")
+                    continue
+        
+        stream_data = self.normalize_stream_data(stream_data, is_local=bool(stream_data and stream_data.get('is_local')))
 
-                if stream_data.get('is_local', False):
-                    source = discord.FFmpegOpusAudio(stream_data['url'], **self.FFMPEG_OPTIONS)
-                else:
+        if not stream_data:
+            await say("❌ Unable to play this track. Please try another.")
+            return None
+        
+        # Cache successful stream URL if it's not a local file
+        if not stream_data.get('is_local', False):
+            await self.cache_stream(cache_key, stream_data)
+
+        return stream_data
+
+    async def start_ffmpeg(self, stream_data, guild_id, start_at=0.0, gain_db=0.0):
+        """Take an ffmpeg slot and start the process; the slot is given back if it fails to start
+
+        Raises SchedulerSaturated when no slot frees up in time.
+        """
+        try:
+            await asyncio.wait_for(self.ffmpeg_scheduler.acquire(guild_id), self.resolver.timeout)
+        except asyncio.TimeoutError:
+            raise SchedulerSaturated(f"ffmpeg: no slot freed up within {self.resolver.timeout}s")
+        try:
+            with self.metrics.stage('ffmpeg_spawn'):
+                return self.create_audio_source(stream_data, start_at, gain_db)
+        except BaseException:
+            self.ffmpeg_scheduler.release(guild_id)
+            raise
+
+    async def open_source(self, track, guild_id, channel, start_at=0.0):
+        """Resolve a track and start its ffmpeg process
+
+        Returns (source, stream_data), or None after telling the channel why
+        the track cannot be played. The caller owns the returned source and
+        its ffmpeg slot. The slot is only taken once a stream has been
+        resolved, so slow resolutions and downloads never hold one.
+        """
+        stream_data = await self.resolve_stream(track, guild_id, notify=channel.send)
+        if not stream_data:
+            return None
+        gain_db = await self.track_gain(track, guild_id)
+
+        try:
+            try:
+                source = await self.start_ffmpeg(stream_data, guild_id, start_at, gain_db)
+            except SchedulerSaturated:
+                raise
+            except Exception as e:
+                if stream_data.get('is_local', False) or "403 Forbidden" not in str(e):
+                    raise Exception("Unable to play this track")
+
+                await channel.send("⚠️ Stream expired, retrying...")
+                # A fresh URL first; downloading the whole track is the last resort
+                await self.forget_stream(track, guild_id)
+                fresh = await self.resolve_stream(track, guild_id, allow_download=False)
+                if fresh and not fresh.get('is_local', False) and fresh['url'] != stream_data['url']:
                     try:
-                        source = discord.FFmpegOpusAudio(stream_data['url'], **self.FFMPEG_OPTIONS)
-                    except Exception as e:
-                        if "403 Forbidden" in str(e):
-                            await ctx.send("⚠️ Stream expired, retrying...")
-                            if is_youtube:
-                                try:
-                                    output_path = self.cache_dir / f"{video_id}.mp3"
-                                    download_opts = self.ydl_opts.copy()
-                                    download_opts['outtmpl'] = str(self.cache_dir / f"{video_id}.%(ext)s")
-                                    with yt_dlp.YoutubeDL(download_opts) as ydl:
-                                        info = ydl.extract_info(normalized_url, download=True)
-                                        downloaded_path = self.find_downloaded_audio(video_id)
-                                        local_stream_data = self.normalize_stream_data({
-                                            'url': str(downloaded_path or output_path),
-                                            'title': info.get('title', stream_data['title']),
-                                            'is_local': True
-                                        }, is_local=True)
-                                        if not local_stream_data:
-                                            raise Exception("Downloaded audio file was not found")
-                                        stream_data = local_stream_data
-                                        source = discord.FFmpegOpusAudio(stream_data['url'], **self.FFMPEG_OPTIONS)
-                                except Exception as dl_err:
-                                    logger.error(f"Download after 403 error failed: {str(dl_err)}")
-                                    raise Exception("Unable to play this track")
-                            else:
-                                raise Exception("Unable to play this track")
-                        else:
-                            raise Exception("Unable to play this track")
+                        return await self.start_ffmpeg(fresh, guild_id, start_at, gain_db), fresh
+                    except SchedulerSaturated:
+                        raise
+                    except Exception as retry_err:
+                        logger.warning(f"Fresh stream URL failed too: {str(retry_err)}")
+                if not (track.extractor == 'youtube' and track.video_id):
+                    raise Exception("Unable to play this track")
+
+                video_id = track.video_id
+                try:
+                    info, downloaded_path = await self.download_audio(
+                        video_id, f"https://www.youtube.com/watch?v={video_id}", guild_id
+                    )
+                    local_stream_data = self.normalize_stream_data({
+                        'url': str(downloaded_path),
+                        'title': info.get('title', stream_data['title']),
+                        'is_local': True,
+                        'source': 'download'
+                    }, is_local=True) if downloaded_path else None
+                    if not local_stream_data:
+                        raise Exception("Downloaded audio file was not found")
+                except ResolverCancelled:
+                    raise
+                except Exception as dl_err:
+                    logger.error(f"Download after 403 error failed: {str(dl_err)}")
+                    raise Exception("Unable to play this track")
+                stream_data = local_stream_data
+                source = await self.start_ffmpeg(stream_data, guild_id, start_at, gain_db)
+        except ResolverCancelled:
+            raise
+        except SchedulerSaturated:
+            await channel.send("❌ Too many tracks are playing right now, try again in a moment.")
+            return None
+        except Exception as e:
+            logger.error(f"Error creating audio source: {str(e)}")
+            await channel.send("❌ Unable to play this track.")
+            return None
+
+        return source, stream_data
+
+    async def loudness_key(self, track, guild_id=None):
+        """Loudness index key: the same extractor:id the stream cache uses"""
+        if track.extractor == 'youtube' and track.video_id:
+            return f"youtube:{track.video_id}"
+        return await self.media_cache_key(track.webpage_url, guild_id)
+
+    async def track_gain(self, track, guild_id=None):
+        """Normalization gain in dB for a track, 0.0 until it has been measured"""
+        if not self.loudness_enabled:
+            return 0.0
+        measurement = self.loudness_index.get_loudness(await self.loudness_key(track, guild_id))
+        return gain_for(measurement, self.loudness_target)
+
+    def schedule_loudness_measurement(self, track, guild_id):
+        """Measure a track that just started playing, if it is new and there is spare ffmpeg capacity"""
+        if not self.loudness_enabled or not track.stream_url:
+            return
+        if not track.duration or track.duration > MAX_MEASURE_SECONDS:
+            return  # Unknown length may be a live stream
+        if len(self.loudness_jobs) >= self.loudness_max_jobs:
+            return
+
+        async def measure(url, is_local):
+            key = await self.loudness_key(track, guild_id)
+            if key in self.loudness_measuring or self.loudness_index.get_loudness(key) is not None:
+                return
+            # Warm priority: only admitted while no playback is waiting for ffmpeg
+            try:
+                await self.ffmpeg_scheduler.acquire(guild_id, PRIORITY_WARM)
+            except SchedulerSaturated:
+                return
+            self.loudness_measuring.add(key)
+            try:
+                with self.metrics.stage('loudness_measure'):
+                    measurement = await measure_loudness(url, is_local=is_local)
+                if measurement:
+                    self.loudness_index.put_loudness(key, measurement)
+                    logger.info(
+                        f"Measured {track.display_title}: {measurement['integrated']:.1f} LUFS, "
+                        f"peak {measurement['peak']:.1f} dBTP"
+                    )
             except Exception as e:
-                logger.error(f"Error creating audio source: {str(e)}")
-                await ctx.send("❌ Unable to play this track.")
+                logger.warning(f"Loudness measurement failed for {track.display_title}: {str(e)}")
+            finally:
+                self.ffmpeg_scheduler.release(guild_id)
+                self.loudness_measuring.discard(key)
+
+        task = asyncio.create_task(measure(track.stream_url, track.is_local))
+        self.loudness_jobs.add(task)
+        task.add_done_callback(self.loudness_jobs.discard)
+
+    async def broadcast_key(self, track, guild_id):
+        """Key under which guilds share one pipeline for the same track"""
+        if track.extractor == 'youtube' and track.video_id:
+            return f"youtube:{track.video_id}"
+        return await self.media_cache_key(track.webpage_url, guild_id)
+
+    async def play_song(self, player, track, start_at=0.0, resuming=False):
+        """Play a song using multiple fallback methods
+
+        Only called from the player task; announcements go to the text
+        channel the track was requested from. With broadcast enabled, a
+        guild that starts a track another guild is already playing reads
+        that pipeline's frames instead of resolving and encoding it again.
+        ``resuming`` reopens a track that died early, at ``start_at``
+        seconds; it is not announced again and keeps its recovery count.
+        """
+        url = track.webpage_url
+        guild_id = player.guild_id
+        channel = player.channel
+        loop = self.bot.loop
+        ffmpeg_slot = False
+        # From the command that started it, if it played right away
+        setup_started = track.requested_at or time.perf_counter()
+        track.requested_at = None
+        stream_source = 'broadcast'
+        handed_over = None
+
+        def release_ffmpeg_slot():
+            # Called from the audio thread when the ffmpeg process goes away
+            try:
+                loop.call_soon_threadsafe(self.ffmpeg_scheduler.release, guild_id)
+            except RuntimeError:
+                pass  # Event loop already closed
+
+        try:
+            vc = player.voice_client
+            if vc is None or not vc.is_connected():
+                await channel.send("❌ Voice connection lost.")
                 return
-            
-            self.current_songs[str(ctx.guild.id)] = stream_data['title']
-            self.current_urls[str(ctx.guild.id)] = url
-            
-            vc = self.voice_clients[str(ctx.guild.id)]
+
+            # A pipeline that starts mid-track cannot be shared
+            key = await self.broadcast_key(track, guild_id) if self.broadcast is not None and not resuming else None
+            source = self.broadcast.join(key) if key else None
+            if source is not None:
+                logger.info(f"Guild {guild_id} joined the shared stream for {key}")
+            else:
+                # Let an in-flight prefetch of this track finish instead of racing it
+                pending = self.prefetching.get(id(track))
+                if pending is not None and not pending.done():
+                    await asyncio.wait([pending], timeout=self.resolver.timeout)
+
+                opened = await self.open_source(track, guild_id, channel, start_at)
+                if opened is None:
+                    return
+                source, stream_data = opened
+                ffmpeg_slot = True
+                track.update_from_stream_data(stream_data)
+                stream_source = stream_data.get('source', 'unknown')
+                if not resuming:
+                    self.schedule_loudness_measurement(track, guild_id)
+
+                if key:
+                    # The slot now lives as long as the shared pipeline
+                    source = self.broadcast.publish(key, source, on_close=release_ffmpeg_slot)
+                    ffmpeg_slot = False
+
             if not vc.is_connected():
-                await ctx.send("❌ Voice connection lost.")
+                source.cleanup()
+                await channel.send("❌ Voice connection lost.")
                 return
-            
-            vc.play(source, after=lambda e: asyncio.run_coroutine_threadsafe(
-                self.play_next(ctx), self.bot.loop).result())
-            
+
+            def first_frame():
+                # Runs on the audio thread once the first Opus frame is read
+                now = time.perf_counter()
+                self.metrics.observe_stage('first_packet', now - handed_over)
+                if not resuming:
+                    # Recoveries would skew what listeners actually wait for
+                    self.metrics.observe_ttfa(stream_source, guild_id, now - setup_started)
+
+            source = TrackedSource(source, start_at, on_start=first_frame)
+            owns_slot = ffmpeg_slot
+
+            def after(error, source=source):
+                # Runs on the audio thread: hand over to the player task and return
+                if error:
+                    logger.error(f"Playback error in guild {guild_id}: {error}")
+                if owns_slot:
+                    release_ffmpeg_slot()
+                try:
+                    loop.call_soon_threadsafe(player.post, FINISHED, source)
+                except RuntimeError:
+                    pass  # Event loop already closed
+
+            player.source = source
+            handed_over = time.perf_counter()
+            try:
+                vc.play(source, after=after)
+            except Exception:
+                player.source = None
+                source.cleanup()
+                raise
+            ffmpeg_slot = False  # Released by after() or the shared pipeline from here on
+            player.current = track
+            player.track_started = time.time() - start_at
+            player.touch()
+            self.schedule_prefetch(guild_id)
+
+            if resuming:
+                if start_at:
+                    await channel.send(f"↩️ Stream interrupted, resumed at {format_duration(start_at)}")
+                else:
+                    await channel.send("↩️ Stream failed to start, retrying...")
+                return
+
+            player.recoveries = 0
             embed = discord.Embed(
                 title="🎵 Now Playing",
-                description=f"**{stream_data['title']}**",
+                description=f"**{track.display_title}**",
                 color=discord.Color.green()
             )
-            await ctx.send(embed=embed)
+            if track.duration:
+                embed.set_footer(text=f"Duration: {track.duration_string}")
+            await channel.send(embed=embed)
             
+        except ResolverCancelled:
+            # Skip, stop or leave: whoever cancelled decides what plays next
+            logger.info(f"Resolution of {url} cancelled for guild {guild_id}")
         except Exception as e:
             logger.error(f"Play song error: {str(e)}\n{traceback.format_exc()}")
-            await ctx.send("❌ An error occurred while trying to play the track.")
+            await channel.send("❌ An error occurred while trying to play the track.")
+        finally:
+            if ffmpeg_slot:
+                self.ffmpeg_scheduler.release(guild_id)
+
+    def schedule_prefetch(self, guild_id):
+        """Start resolving the upcoming tracks of a guild in the background"""
+        player = self.players.get(guild_id)
+        if player is None or not player.queue or self.get_prefetch_depth(guild_id) <= 0:
+            return
+
+        if player.prefetch_task is not None and not player.prefetch_task.done():
+            return
+
+        player.prefetch_task = asyncio.create_task(self.prefetch_queue(player))
+
+    def cancel_prefetch(self, guild_id):
+        player = self.players.get(guild_id)
+        if player is not None and player.prefetch_task is not None:
+            player.prefetch_task.cancel()
+            player.prefetch_task = None
 
-    async def search_youtube(self, query):
+    async def prefetch_queue(self, player):
+        """Resolve stream URLs for the next N queued tracks
+
+        A URL that would expire before its track is estimated to start is
+        refreshed, so the transition only has to open ffmpeg.
+        """
+        guild_id = player.guild_id
+        try:
+            # Estimate when each upcoming track starts, from the current one
+            current = player.current
+            started = player.track_started or time.time()
+            remaining = 0.0
+            if current is not None and current.duration:
+                remaining = max(0.0, current.duration - (time.time() - started))
+
+            for track in list(itertools.islice(player.queue, self.get_prefetch_depth(guild_id))):
+                starts_in = remaining
+                remaining += track.duration or 0
+
+                if track.is_local and self.is_valid_stream_url(track.stream_url):
+                    continue
+                if track.stream_valid(margin=starts_in + EXPIRY_MARGIN):
+                    continue
+
+                track.clear_stream()
+                task = asyncio.create_task(
+                    self.resolve_stream(track, guild_id, allow_download=False, background=True)
+                )
+                self.prefetching[id(track)] = task
+                try:
+                    stream_data = await task
+                except ResolverCancelled:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Prefetch failed for {track.webpage_url}: {str(e)}")
+                    stream_data = None
+                finally:
+                    self.prefetching.pop(id(track), None)
+
+                if stream_data:
+                    track.update_from_stream_data(stream_data)
+                    logger.info(f"Prefetched stream for {track.display_title} in guild {guild_id}")
+        except (ResolverCancelled, asyncio.CancelledError):
+            pass
+        finally:
+            if player.prefetch_task is asyncio.current_task():
+                player.prefetch_task = None
+
+    def get_prefetch_depth(self, guild_id):
+        return self.music_settings.get(guild_id, {}).get('prefetch', self.default_prefetch_depth)
+
+    def load_music_settings(self):
+        try:
+            with open(data_file('music_settings.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"Error loading music settings: {e}")
+            return {}
+
+    def save_music_settings(self):
+        with open(data_file('music_settings.json'), 'w') as f:
+            json.dump(self.music_settings, f, indent=4)
+
+    async def search_youtube(self, query, guild_id=None):
+        """Search YouTube, answering repeat queries from the search cache"""
+        results = self.search_cache.get_results(query)
+        if results is not None:
+            return results
+
+        results = await self._search_youtube_backends(query, guild_id)
+        self.search_cache.put_results(query, results)
+        return results
+
+    async def _search_youtube_backends(self, query, guild_id=None):
         """Search YouTube with multiple fallback methods"""
         # First try with yt-dlp
         try:
@@ -850,19 +1700,19 @@ class Music(commands.Cog):
                 'http_headers': self.ydl_opts.get('http_headers')
             }
             
-            with yt_dlp.YoutubeDL(search_opts) as ydl:
-                info = ydl.extract_info(f"ytsearch10:{query}", download=False)
-                if 'entries' in info and info['entries']:
-                    # Format results
-                    formatted_results = []
-                    for entry in info['entries']:
-                        formatted_results.append({
-                            'id': entry.get('id'),
-                            'title': entry.get('title', 'Unknown Title'),
-                            'duration_string': entry.get('duration_string', 'Unknown'),
-                            'webpage_url': entry.get('url') or f"https://www.youtube.com/watch?v={entry.get('id')}"
-                        })
-                    return formatted_results
+            info = await self.extract_info(f"ytsearch10:{query}", guild_id=guild_id, opts=search_opts)
+            if 'entries' in info and info['entries']:
+                # Format results
+                formatted_results = []
+                for entry in info['entries']:
+                    formatted_results.append({
+                        'id': entry.get('id'),
+                        'title': entry.get('title', 'Unknown Title'),
+                        'duration': entry.get('duration'),
+                        'duration_string': entry.get('duration_string', 'Unknown'),
+                        'webpage_url': entry.get('url') or f"https://www.youtube.com/watch?v={entry.get('id')}"
+                    })
+                return formatted_results
                     
         except Exception as e:
             print(f"yt-dlp search error: {str(e)}")
@@ -871,59 +1721,63 @@ class Music(commands.Cog):
                 print("Trying to update cookies due to bot detection...")
                 await self.update_cookies()
         
-        # Try Invidious API next
-        try:
-            # Randomly choose an Invidious instance
-            instance = random.choice(self.invidious_instances)
-            
-            # Search using Invidious API
-            encoded_query = urllib.parse.quote(query)
-            api_url = f"{instance}/api/v1/search?q={encoded_query}&type=video"
-            
-            response = requests.get(api_url, timeout=10)
-            if response.status_code == 200:
-                results = response.json()
-                
-                # Format results similar to previous format
-                formatted_results = []
-                for video in results[:10]:  # Limit to 10 results
-                    formatted_results.append({
-                        'id': video.get('videoId'),
-                        'title': video.get('title', 'Unknown Title'),
-                        'duration_string': self._format_duration(video.get('lengthSeconds', 0)),
-                        'channel': video.get('author'),
-                        'webpage_url': f"https://www.youtube.com/watch?v={video.get('videoId')}"
-                    })
-                return formatted_results
+        # Try Invidious API next, on the healthiest instance
+        for instance in self.instance_health.ordered('invidious', limit=1):
+            started = time.monotonic()
+            try:
+                # Search using Invidious API
+                encoded_query = urllib.parse.quote(query)
+                api_url = f"{instance}/api/v1/search?q={encoded_query}&type=video"
                 
-        except Exception as e:
-            print(f"Invidious API search error: {str(e)}")
+                response = await self.http.get(api_url)
+                if response.status == 200:
+                    results = response.json()
+                    
+                    # Format results similar to previous format
+                    formatted_results = []
+                    for video in results[:10]:  # Limit to 10 results
+                        formatted_results.append({
+                            'id': video.get('videoId'),
+                            'title': video.get('title', 'Unknown Title'),
+                            'duration': video.get('lengthSeconds'),
+                            'duration_string': self._format_duration(video.get('lengthSeconds', 0)),
+                            'channel': video.get('author'),
+                            'webpage_url': f"https://www.youtube.com/watch?v={video.get('videoId')}"
+                        })
+                    self.instance_health.record_success(instance, time.monotonic() - started)
+                    return formatted_results
+                    
+            except Exception as e:
+                print(f"Invidious API search error: {str(e)}")
+            self.instance_health.record_failure(instance, time.monotonic() - started)
         
         # Try Piped API if Invidious fails
-        try:
-            # Randomly choose a Piped instance
-            instance = random.choice(self.piped_instances)
-            
-            # Search using Piped API
-            encoded_query = urllib.parse.quote(query)
-            api_url = f"{instance}/search?q={encoded_query}&filter=videos"
-            
-            response = requests.get(api_url, timeout=10)
-            if response.status_code == 200:
-                results = response.json()
+        for instance in self.instance_health.ordered('piped', limit=1):
+            started = time.monotonic()
+            try:
+                # Search using Piped API
+                encoded_query = urllib.parse.quote(query)
+                api_url = f"{instance}/search?q={encoded_query}&filter=videos"
                 
-                # Format results
-                formatted_results = []
-                for item in results[:10]:
-                    formatted_results.append({
-                        'id': item.get('id'),
-                        'title': item.get('title', 'Unknown Title'),
-                        'duration_string': item.get('duration', 'Unknown'),
-                        'webpage_url': f"https://www.youtube.com/watch?v={item.get('id')}"
-                    })
-                return formatted_results
-        except Exception as e:
-            print(f"Piped API search error: {str(e)}")
+                response = await self.http.get(api_url)
+                if response.status == 200:
+                    results = response.json()
+                    
+                    # Format results
+                    formatted_results = []
+                    for item in results[:10]:
+                        formatted_results.append({
+                            'id': item.get('id'),
+                            'title': item.get('title', 'Unknown Title'),
+                            'duration': item.get('duration'),
+                            'duration_string': item.get('duration', 'Unknown'),
+                            'webpage_url': f"https://www.youtube.com/watch?v={item.get('id')}"
+                        })
+                    self.instance_health.record_success(instance, time.monotonic() - started)
+                    return formatted_results
+            except Exception as e:
+                print(f"Piped API search error: {str(e)}")
+            self.instance_health.record_failure(instance, time.monotonic() - started)
         
         # If all else fails, try direct search
         try:
@@ -938,142 +1792,98 @@ class Music(commands.Cog):
 
     def _format_duration(self, seconds):
         """Format duration from seconds to MM:SS"""
-        minutes, seconds = divmod(int(seconds), 60)
-        hours, minutes = divmod(minutes, 60)
-        if hours > 0:
-            return f"{hours}:{minutes:02d}:{seconds:02d}"
-        else:
-            return f"{minutes}:{seconds:02d}"
+        return format_duration(seconds)
+
+    async def handle_spotify_url(self, route, fallback=True):
+        """Extract a search query from a Spotify track route
+
+        Without ``fallback``, a track whose title cannot be found gives None
+        instead of a generic search.
+        """
+        if route.kind == SPOTIFY_TRACK:
+            url = f"https://open.spotify.com/track/{route.spotify_id}"
+            track_id = route.spotify_id
+            cached_query = self.spotify_cache.get_query(track_id)
+            if cached_query:
+                return cached_query
 
-    async def handle_spotify_url(self, url):
-        """Extract track info from Spotify URL"""
-        # Spotify URL patterns
-        track_pattern = r'https?://[^/]*spotify\.com/track/([a-zA-Z0-9]+)'
-        
-        track_match = re.match(track_pattern, url)
-        if track_match:
             try:
                 # Try to get the song name from the page title
                 headers = {'User-Agent': 'Mozilla/5.0'}
-                response = requests.get(url, headers=headers)
-                if response.status_code == 200:
+                response = await self.http.get(url, headers=headers)
+                if response.status == 200:
                     soup = BeautifulSoup(response.text, 'html.parser')
                     title = soup.title.string
                     if title and 'Spotify' in title:
                         # Remove "- song and lyrics | Spotify" or similar
                         track_info = re.sub(r'\s*[-|]\s*(?:song and lyrics\s*)?(?:\|\s*)?Spotify\s*$', '', title).strip()
                         if track_info:
+                            self.spotify_cache.put_query(track_id, track_info)
                             return track_info
 
             except Exception as e:
                 print(f"Error extracting Spotify title: {e}")
 
-            # Fallback: Try to get track name from the URL slug
-            parts = url.split('?')[0].split('/')  # Remove query parameters
-            if len(parts) > 4:
-                # The last part of the URL might contain the song name
-                track_slug = parts[-1]
-                # If there's a query string, remove it
-                if '?' in track_slug:
-                    track_slug = track_slug.split('?')[0]
-                # Convert slug to readable text
-                track_info = track_slug.replace('-', ' ').replace('_', ' ')
-                # If it's just the ID, try the previous part which might be the song name
-                if re.match(r'^[A-Za-z0-9]{22}$', track_info):
-                    if len(parts) > 5:
-                        track_info = parts[-2].replace('-', ' ').replace('_', ' ')
-                return track_info
-            
-            # If we can't get the name from the URL, at least add "spotify song" to help search
-            return "spotify song"
+            # Track URLs carry only the id, so at least add "spotify song" to help search
+            return "spotify song" if fallback else None
         return None
 
     @commands.command()
     async def play(self, ctx, *, query):
         """Play a song by URL (YouTube/Spotify) or search term"""
+        # Time to first audio is measured from here, voice connect included
+        requested_at = time.perf_counter()
         try:
             if not ctx.author.voice:
                 return await ctx.send("❌ You need to be in a voice channel!")
 
             guild_id = str(ctx.guild.id)
-
-            try:
-                vc = await self.ensure_voice_client(ctx)
-            except discord.errors.ConnectionClosed:
-                await self.disconnect_voice_client(guild_id, ctx.guild)
-                await ctx.send(self.build_voice_connection_error())
-                return
-            except asyncio.TimeoutError:
-                await self.disconnect_voice_client(guild_id, ctx.guild)
-                await ctx.send(self.build_voice_connection_error())
-                return
-            except RuntimeError as e:
-                logger.error(f"Voice runtime error: {str(e)}")
-                await self.disconnect_voice_client(guild_id, ctx.guild)
-                await ctx.send(str(e))
-                return
-            except Exception as e:
-                logger.error(f"Voice connection error: {str(e)}")
-                await self.disconnect_voice_client(guild_id, ctx.guild)
-                await ctx.send(self.build_voice_connection_error())
+            if not await self.join_author_channel(ctx):
                 return
 
-            if guild_id not in self.queue:
-                self.queue[guild_id] = []
+            player = self.get_player(guild_id)
+            player.channel = ctx.channel
 
-            spotify_info = await self.handle_spotify_url(query)
-            if spotify_info:
-                await ctx.send(f"🎵 Found Spotify track, searching...")
-                query = spotify_info
+            route = classify(query)
+            if route.kind == SPOTIFY_TRACK:
+                spotify_info = await self.handle_spotify_url(route)
+                if spotify_info:
+                    await ctx.send(f"🎵 Found Spotify track, searching...")
+                    query = spotify_info
+                    route = classify(query)
 
-            url_pattern = re.compile(
-                r'^(?:http|ftp)s?://'
-                r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'
-                r'localhost|'
-                r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
-                r'(?::\d+)?'
-                r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-
-            if url_pattern.match(query):
-                is_youtube = await self.is_youtube_url(query)
-                
-                if is_youtube and 'spotify.com' not in query:
-                    video_id = await self.extract_youtube_id(query)
-                    if not video_id:
-                        logger.error(f"Could not extract video ID from URL: {query}")
-                    
-                    try:
-                        if vc.is_playing():
-                            self.queue[guild_id].append(query)
-                            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                                info = ydl.extract_info(query, download=False)
-                                await ctx.send(f"🎵 Added to queue: **{info['title']}**")
-                        else:
-                            await self.play_song(ctx, query)
-                    except Exception as e:
-                        logger.error(f"YouTube playback error: {str(e)}")
-                        await ctx.send("❌ Unable to play this track.")
-                elif 'spotify.com' in query:
-                    await ctx.send("⚠️ Spotify URL detected, searching...")
-                    await self.play_song(ctx, query)
-                else:
-                    try:
-                        if vc.is_playing():
-                            self.queue[guild_id].append(query)
-                            await ctx.send("🎵 Added to queue")
-                        else:
-                            await self.play_song(ctx, query)
-                    except Exception as e:
-                        logger.error(f"Non-YouTube URL error: {str(e)}")
-                        await ctx.send("❌ Unable to play this track.")
+            if route.kind == YOUTUBE_PLAYLIST:
+                try:
+                    await self.enqueue_playlist(ctx, route.query, route.video_id, requested_at)
+                except ResolverCancelled:
+                    pass
+                except Exception as e:
+                    logger.error(f"YouTube playlist error: {str(e)}")
+                    await ctx.send("❌ Unable to load this playlist.")
+            elif route.kind != SEARCH:
+                try:
+                    if player.busy:
+                        track = await self.resolve_track(Track(route.query), guild_id)
+                        player.queue.append(track)
+                        self.schedule_prefetch(guild_id)
+                        await ctx.send(f"🎵 Added to queue: **{track.display_title}**")
+                    else:
+                        track = Track(route.query)
+                        if not player.queue:
+                            track.requested_at = requested_at
+                        player.queue.append(track)
+                        player.post(ADVANCE)
+                except ResolverCancelled:
+                    pass
+                except Exception as e:
+                    logger.error(f"URL playback error ({route.kind}): {str(e)}")
+                    await ctx.send("❌ Unable to play this track.")
             else:
                 await ctx.send("🔍 Searching...")
-                results = await self.search_youtube(query)
+                results = await self.search_youtube(query, guild_id)
                 if not results:
                     return await ctx.send("❌ No results found.")
 
-                self.search_results[ctx.author.id] = results
-
                 embed = discord.Embed(
                     title="🔍 Search Results",
                     description="Type the number (1-10) or 'cancel':",
@@ -1101,20 +1911,21 @@ class Music(commands.Cog):
                 try:
                     msg = await self.bot.wait_for('message', check=check, timeout=30.0)
                     if msg.content.lower() == 'cancel':
-                        del self.search_results[ctx.author.id]
                         return await ctx.send("❌ Search cancelled.")
 
                     selected = results[int(msg.content) - 1]
-                    url = selected['webpage_url']
-
-                    if vc.is_playing():
-                        self.queue[guild_id].append(url)
-                        await ctx.send(f"🎵 Added to queue: **{selected['title']}**")
+                    track = Track.from_search_result(selected)
+
+                    if not player.busy and not player.queue:
+                        track.requested_at = requested_at
+                    player.queue.append(track)
+                    if player.busy:
+                        self.schedule_prefetch(guild_id)
+                        await ctx.send(f"🎵 Added to queue: **{track.display_title}**")
                     else:
-                        await self.play_song(ctx, url)
+                        player.post(ADVANCE)
 
                 except asyncio.TimeoutError:
-                    del self.search_results[ctx.author.id]
                     await ctx.send("❌ Search timed out.")
                 except Exception as e:
                     logger.error(f"Search selection error: {str(e)}")
@@ -1124,6 +1935,151 @@ class Music(commands.Cog):
             logger.error(f"Play command error: {str(e)}\n{traceback.format_exc()}")
             await ctx.send("❌ An error occurred while processing your request.")
 
+    @staticmethod
+    def split_bulk_queries(text):
+        """One item per line; a line holding only links is split into one item per link"""
+        items = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            # Discord users wrap links in <> to suppress embeds
+            words = [word.strip('<>') for word in line.split()]
+            if len(words) > 1 and all(classify(word).kind != SEARCH for word in words):
+                items.extend(words)
+            else:
+                items.append(line.strip('<>'))
+        return items
+
+    async def resolve_bulk_item(self, query, guild_id):
+        """Tracks for one %playmany item, plus a playlist title if it was one"""
+        route = classify(query)
+        if route.kind == SPOTIFY_TRACK:
+            query = await self.handle_spotify_url(route, fallback=False)
+            if not query:
+                return None, []
+            route = classify(query)
+
+        if route.kind == YOUTUBE_PLAYLIST:
+            return await self.load_playlist(route.query, guild_id, route.video_id)
+        if route.kind != SEARCH:
+            # The full resolver chain, so a dead link is reported instead of queued
+            track = Track(route.query)
+            stream_data = await self.resolve_stream(track, guild_id, allow_download=False, background=True)
+            if not stream_data:
+                return None, []
+            track.update_from_stream_data(stream_data)
+            return None, [track]
+
+        results = await self.search_youtube(query, guild_id)
+        return None, [Track.from_search_result(results[0])] if results else []
+
+    @commands.command()
+    async def playmany(self, ctx, *, queries):
+        """Queue several URLs or search terms at once, one per line"""
+        requested_at = time.perf_counter()
+        try:
+            if not ctx.author.voice:
+                return await ctx.send("❌ You need to be in a voice channel!")
+
+            items = self.split_bulk_queries(queries)
+            skipped = max(0, len(items) - self.bulk_limit)
+            items = items[:self.bulk_limit]
+
+            guild_id = str(ctx.guild.id)
+            if not await self.join_author_channel(ctx):
+                return
+
+            player = self.get_player(guild_id)
+            player.channel = ctx.channel
+            generation = player.generation
+
+            def wanted():
+                # %stop bumps the generation, %leave replaces the player
+                return self.players.get(guild_id) is player and player.generation == generation
+
+            # Items resolve concurrently but join the queue strictly in input
+            # order: each finished item releases the completed prefix, so the
+            # first track can start while later ones are still resolving.
+            results = [None] * len(items)
+            next_index = 0
+            semaphore = asyncio.Semaphore(self.bulk_concurrency)
+
+            def release_prefix():
+                nonlocal next_index
+                if not wanted():
+                    return
+                released = False
+                while next_index < len(results) and results[next_index] is not None:
+                    tracks = results[next_index][1]
+                    if tracks and not player.busy and not player.queue:
+                        tracks[0].requested_at = requested_at
+                    player.queue.extend(tracks)
+                    released = released or bool(results[next_index][1])
+                    next_index += 1
+                if released:
+                    self.schedule_prefetch(guild_id)
+                    player.post(ADVANCE)
+
+            async def resolve(index, query):
+                try:
+                    async with semaphore:
+                        if not wanted():
+                            return
+                        results[index] = await self.resolve_bulk_item(query, guild_id)
+                except ResolverCancelled:
+                    results[index] = (None, [])
+                except Exception as e:
+                    logger.warning(f"Could not add '{query}' from %playmany: {str(e)}")
+                    results[index] = (None, [])
+                release_prefix()
+
+            async with ctx.typing():
+                await asyncio.gather(*(resolve(i, query) for i, query in enumerate(items)))
+
+            # Only what actually reached the queue before any %stop or %leave
+            queued = results[:next_index]
+            dropped = len(items) - next_index
+            added = sum(len(tracks) for _, tracks in queued)
+            failed = 0
+            lines = []
+            for i, (query, (playlist_title, tracks)) in enumerate(zip(items, queued), 1):
+                if not tracks:
+                    failed += 1
+                    lines.append(f"{i}. ❌ {discord.utils.escape_markdown(query)[:80]}")
+                elif playlist_title is not None or len(tracks) > 1:
+                    lines.append(f"{i}. 📃 {playlist_title or 'Playlist'} ({len(tracks)} tracks)")
+                else:
+                    lines.append(f"{i}. {tracks[0].display_title} ({tracks[0].duration_string})")
+
+            # Embed descriptions hold at most 4096 characters
+            description = ""
+            for shown, line in enumerate(lines):
+                if len(description) + len(line) > 3900:
+                    description += f"...and {len(lines) - shown} more"
+                    break
+                description += line + "\n"
+
+            embed = discord.Embed(
+                title=f"🎵 Added {added} track{'s' if added != 1 else ''} to the queue",
+                description=description,
+                color=discord.Color.blue() if added else discord.Color.red()
+            )
+            notes = []
+            if failed:
+                notes.append(f"{failed} item{'s' if failed != 1 else ''} could not be found")
+            if dropped:
+                notes.append(f"{dropped} item{'s' if dropped != 1 else ''} dropped because playback was stopped")
+            if skipped:
+                notes.append(f"{skipped} item{'s' if skipped != 1 else ''} over the limit of {self.bulk_limit} ignored")
+            if notes:
+                embed.set_footer(text=" • ".join(notes))
+            await ctx.send(embed=embed)
+
+        except Exception as e:
+            logger.error(f"Playmany command error: {str(e)}\n{traceback.format_exc()}")
+            await ctx.send("❌ An error occurred while processing your request.")
+
     @commands.command()
     async def testplay(self, ctx):
         """Um comando simples para testar a conexão de voz com um arquivo local."""
@@ -1178,88 +2134,190 @@ class Music(commands.Cog):
     async def stop(self, ctx):
         """Stop playing and clear the queue"""
         guild_id = str(ctx.guild.id)
-        vc = ctx.guild.voice_client or self.voice_clients.get(guild_id)
+        vc = self.get_voice_client(ctx)
         if vc:
-            self.voice_clients[guild_id] = vc
-            if vc.is_playing():
-                self.skip_requested.add(guild_id)
-                vc.stop()
-            self.queue[guild_id] = []
-            self.loop_enabled[guild_id] = False
-            self.current_urls.pop(guild_id, None)
+            player = self.get_player(guild_id)
+            player.voice_client = vc
+            player.post(STOP)
             await ctx.send("⏹️ Stopped playing and cleared the queue")
 
     @commands.command()
     async def skip(self, ctx):
         """Skip the current song"""
-        guild_id = str(ctx.guild.id)
-        vc = ctx.guild.voice_client or self.voice_clients.get(guild_id)
-        if vc:
-            self.voice_clients[guild_id] = vc
-            if vc.is_playing():
-                self.skip_requested.add(guild_id)
-                vc.stop()
-                await ctx.send("⏭️ Skipped current song")
-            else:
-                await ctx.send("Nothing is playing!")
+        player = self.players.get(str(ctx.guild.id))
+        if player is not None and player.busy:
+            # Cancels the track even while it is still being resolved
+            player.post(SKIP)
+            await ctx.send("⏭️ Skipped current song")
+        elif self.get_voice_client(ctx):
+            await ctx.send("Nothing is playing!")
 
     @commands.command()
     async def queue(self, ctx):
         """Show the current queue"""
-        guild_id = str(ctx.guild.id)
-        if guild_id not in self.queue or not self.queue[guild_id]:
+        player = self.players.get(str(ctx.guild.id))
+        if player is None or not player.queue:
             return await ctx.send("Queue is empty!")
             
         embed = discord.Embed(title="🎵 Queue", color=discord.Color.blue())
         
         # Add current song
-        if guild_id in self.current_songs:
-            embed.add_field(name="Now Playing", value=self.current_songs[guild_id], inline=False)
+        if player.current is not None:
+            embed.add_field(name="Now Playing", value=player.current.display_title, inline=False)
         
-        # Add queued songs
-        with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-            for i, url in enumerate(self.queue[guild_id], 1):
-                try:
-                    info = ydl.extract_info(url, download=False)
-                    embed.add_field(name=f"{i}. ", value=info['title'], inline=False)
-                except:
-                    embed.add_field(name=f"{i}. ", value="Unable to fetch title", inline=False)
+        # Add queued songs straight from the stored track records. Embeds
+        # hold at most 25 fields, so long queues are summarized.
+        tracks = player.queue
+        for i, track in enumerate(itertools.islice(tracks, 20), 1):
+            embed.add_field(name=f"{i}. ", value=f"{track.display_title} ({track.duration_string})", inline=False)
+        if len(tracks) > 20:
+            embed.set_footer(text=f"...and {len(tracks) - 20} more")
                 
         await ctx.send(embed=embed)
 
     @commands.command(name="loop")
     async def loop_track(self, ctx):
         """Toggle looping for the current song"""
-        guild_id = str(ctx.guild.id)
-        vc = ctx.guild.voice_client or self.voice_clients.get(guild_id)
+        player = self.players.get(str(ctx.guild.id))
+        vc = self.get_voice_client(ctx)
 
-        if not vc or not (vc.is_playing() or vc.is_paused()) or guild_id not in self.current_urls:
+        if not vc or not (vc.is_playing() or vc.is_paused()) or player is None or player.current is None:
             await ctx.send("Nothing is playing!")
             return
 
-        self.loop_enabled[guild_id] = not self.loop_enabled.get(guild_id, False)
-        status = "enabled" if self.loop_enabled[guild_id] else "disabled"
+        player.loop = not player.loop
+        status = "enabled" if player.loop else "disabled"
         await ctx.send(f"🔁 Loop {status}")
 
     @commands.command()
     async def leave(self, ctx):
         """Leave the voice channel"""
         guild_id = str(ctx.guild.id)
-        if guild_id in self.voice_clients or ctx.guild.voice_client:
+        if guild_id in self.players or ctx.guild.voice_client:
             await self.disconnect_voice_client(guild_id, ctx.guild)
-            self.queue[guild_id] = []
-            self.loop_enabled[guild_id] = False
-            self.current_urls.pop(guild_id, None)
-            self.skip_requested.discard(guild_id)
             await ctx.send("👋 Left the voice channel")
 
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def prefetch(self, ctx, depth: int = None):
+        """Show or set how many upcoming tracks are resolved in advance"""
+        guild_id = str(ctx.guild.id)
+        if depth is None:
+            return await ctx.send(f"⏩ Prefetching the next {self.get_prefetch_depth(guild_id)} tracks")
+
+        if not 0 <= depth <= 10:
+            return await ctx.send("❌ Prefetch depth must be between 0 and 10.")
+
+        self.music_settings.setdefault(guild_id, {})['prefetch'] = depth
+        self.save_music_settings()
+        if depth == 0:
+            self.cancel_prefetch(guild_id)
+        else:
+            self.schedule_prefetch(guild_id)
+        await ctx.send(f"⏩ Prefetch depth set to {depth}")
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def instances(self, ctx):
+        """Show health scores and circuit state of the Piped/Invidious mirrors"""
+        embed = discord.Embed(title="🩺 Instance Health", color=discord.Color.blue())
+        now = time.time()
+
+        for kind in ('piped', 'invidious'):
+            lines = []
+            for health in self.instance_health.snapshot(kind):
+                state = health.state(now)
+                icon = {'closed': '🟢', 'half-open': '🟡', 'open': '🔴'}[state]
+                latency = f"{health.latency * 1000:.0f}ms" if health.latency is not None else "n/a"
+                line = f"{icon} `{health.host}` {latency}, {health.success_rate:.0%} ok"
+                if state == 'open':
+                    line += f", retry in {health.open_until - now:.0f}s"
+                elif health.last_failure:
+                    line += f", last failure {now - health.last_failure:.0f}s ago"
+                lines.append(line)
+
+            embed.add_field(name=kind.capitalize(), value="\n".join(lines) or "No instances", inline=False)
+
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    @commands.has_permissions(administrator=True)
+    async def musicstats(self, ctx):
+        """Show time-to-first-audio and per-stage latency percentiles"""
+        def ms(seconds):
+            return "n/a" if seconds is None else f"{seconds * 1000:.0f}ms"
+
+        def line(name, summary):
+            return (f"`{name}` p50 {ms(summary['p50'])}, p95 {ms(summary['p95'])}, "
+                    f"p99 {ms(summary['p99'])} ({summary['count']})")
+
+        stats = self.metrics.snapshot()
+        embed = discord.Embed(title="📊 Music Stats", color=discord.Color.blue())
+
+        embed.add_field(name="Time to first audio", value=line('all', stats['ttfa']), inline=False)
+        guild_stats = stats['guilds'].get(str(ctx.guild.id))
+        if guild_stats:
+            embed.add_field(name="This server", value=line('all', guild_stats), inline=False)
+
+        sources = sorted(stats['sources'].items(), key=lambda item: -item[1]['count'])
+        embed.add_field(
+            name="By stream source",
+            value="\n".join(line(name, summary) for name, summary in sources) or "No tracks played yet",
+            inline=False
+        )
+
+        # Slowest stages first
+        stages = sorted(stats['stages'].items(), key=lambda item: -(item[1]['p95'] or 0))
+        embed.add_field(
+            name="Stages",
+            value="\n".join(line(name, summary) for name, summary in stages) or "Nothing timed yet",
+            inline=False
+        )
+
+        caches = (
+            ('streams', self.stream_cache), ('searches', self.search_cache),
+            ('spotify', self.spotify_cache), ('loudness', self.loudness_index)
+        )
+        cache_lines = []
+        for name, cache in caches:
+            cache_stats = cache.stats()
+            cache_lines.append(
+                f"`{name}` {cache_stats['entries']}/{cache_stats['max_entries']}, "
+                f"{cache_stats['hit_rate']:.0%} hits, {cache_stats['evictions']} evicted"
+            )
+        audio = self.audio_cache.stats()
+        cache_lines.append(
+            f"`audio files` {audio['files']} ({audio['bytes'] / 2**20:.0f}/{audio['max_bytes'] / 2**20:.0f} MB), "
+            f"{audio['hits']} hits, {audio['misses']} misses, {audio['evictions']} evicted"
+        )
+        embed.add_field(name="Caches", value="\n".join(cache_lines), inline=False)
+
+        if self.broadcast:
+            shared = self.broadcast.stats()
+            embed.add_field(
+                name="Shared streams",
+                value=(f"{shared['streams']} streams, {shared['listeners']} listeners, "
+                       f"{shared['shared_joins']} joined a running stream"),
+                inline=False
+            )
+
+        resolver = self.resolver_scheduler.stats()
+        pool = self.resolver.stats()
+        ffmpeg = self.ffmpeg_scheduler.stats()
+        embed.set_footer(text=(
+            f"Resolver: {resolver['active']} running, {resolver['waiting']} waiting · "
+            f"Pool: {pool['active']}/{pool['workers']} busy, {self.resolver.queue_depth} queued, "
+            f"{pool['completed']} done, {pool['failed']} failed, {pool['timed_out']} timed out, "
+            f"{pool['cancelled']} cancelled, {pool['rejected']} rejected · "
+            f"ffmpeg: {ffmpeg['active']}/{ffmpeg['limit']}"
+        ))
+        await ctx.send(embed=embed)
+
     @commands.command()
     async def pause(self, ctx):
         """Pause/Resume the current song"""
-        guild_id = str(ctx.guild.id)
-        vc = ctx.guild.voice_client or self.voice_clients.get(guild_id)
+        vc = self.get_voice_client(ctx)
         if vc:
-            self.voice_clients[guild_id] = vc
             if vc.is_playing():
                 vc.pause()
                 await ctx.send("⏸️ Paused")
@@ -0,0 +1,6 @@
+"""Helpers used by the Music cog.
+
+This package lives inside ``cogs`` so it ships with the cog, but it is a
+directory rather than a ``.py`` file, so ``main.py`` never tries to load it
+as an extension.
+"""
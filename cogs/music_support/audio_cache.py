@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger('music_cog')
+
+# > Audio File Cache <
+# Downloaded tracks live in .private/temp_audio. The directory is scanned once
+# at startup into an in-memory LRU index (video id -> path, size, last access)
+# and kept under a byte budget. Downloads land in an ``.incoming`` directory
+# first and are renamed into place only when complete, so a half-written file
+# is never picked up for playback.
+
+
+class CachedAudio:
+    """Index entry for one cached audio file."""
+
+    __slots__ = ('path', 'size', 'last_access')
+
+    def __init__(self, path, size, last_access):
+        self.path = path
+        self.size = size
+        self.last_access = last_access
+
+
+class AudioFileCache:
+    """Byte-bounded LRU index over the downloaded audio files."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.incoming = self.directory / '.incoming'
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # video id -> CachedAudio, least recently used first
+        self.total_bytes = 0
+        self.download_locks = {}  # video id -> [lock, number of callers using it]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.incoming.mkdir(exist_ok=True)
+        self.scan()
+
+    def scan(self):
+        """Rebuild the index from disk and drop leftovers of interrupted downloads."""
+        for leftover in self.incoming.iterdir():
+            try:
+                leftover.unlink()
+            except OSError:
+                pass
+
+        found = []
+        for path in self.directory.iterdir():
+            if not path.is_file() or path.suffix in ('.part', '.ytdl', '.tmp'):
+                continue
+            stat = path.stat()
+            found.append((stat.st_atime, path.stem, path, stat.st_size))
+
+        self.entries.clear()
+        self.total_bytes = 0
+        for last_access, video_id, path, size in sorted(found):
+            previous = self.entries.pop(video_id, None)
+            if previous is not None:
+                # Same id with another extension (e.g. old .mp3 next to .opus): keep the newest
+                self.total_bytes -= previous.size
+                self._remove_file(previous.path)
+            self.entries[video_id] = CachedAudio(path, size, last_access)
+            self.total_bytes += size
+
+        self.evict()
+        logger.info(f"Audio cache: {len(self.entries)} files, {self.total_bytes / 1024 / 1024:.1f} MB")
+
+    def lookup(self, video_id):
+        """Return the cached file for ``video_id`` and mark it recently used."""
+        entry = self.entries.get(video_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if not entry.path.exists():
+            # Removed behind our back
+            self.entries.pop(video_id)
+            self.total_bytes -= entry.size
+            self.misses += 1
+            return None
+
+        entry.last_access = time.time()
+        self.entries.move_to_end(video_id)
+        self.hits += 1
+        return entry.path
+
+    def download_lock(self, video_id):
+        """Lock that keeps two guilds from downloading the same id at once.
+
+        Every call must be paired with ``release_lock`` once the caller is done.
+        """
+        holders = self.download_locks.get(video_id)
+        if holders is None:
+            holders = self.download_locks[video_id] = [asyncio.Lock(), 0]
+        holders[1] += 1
+        return holders[0]
+
+    def release_lock(self, video_id):
+        holders = self.download_locks.get(video_id)
+        if holders is None:
+            return
+        holders[1] -= 1
+        if holders[1] <= 0:
+            del self.download_locks[video_id]
+
+    def incoming_template(self, video_id):
+        """yt-dlp ``outtmpl`` for a download that has not been committed yet."""
+        return str(self.incoming / f"{video_id}.{uuid.uuid4().hex}.%(ext)s")
+
+    def commit(self, video_id, template):
+        """Atomically move a finished download into the cache and index it."""
+        prefix = Path(template).name.split('%')[0]
+        candidates = [
+            path for path in self.incoming.glob(f"{prefix}*")
+            if path.suffix not in ('.part', '.ytdl')
+        ]
+        if not candidates:
+            return None
+
+        downloaded = max(candidates, key=lambda path: path.stat().st_size)
+        target = self.directory / f"{video_id}{downloaded.suffix}"
+        os.replace(downloaded, target)
+
+        for leftover in candidates:
+            if leftover != downloaded:
+                self._remove_file(leftover)
+
+        previous = self.entries.pop(video_id, None)
+        if previous is not None:
+            self.total_bytes -= previous.size
+            if previous.path != target:
+                self._remove_file(previous.path)
+
+        size = target.stat().st_size
+        self.entries[video_id] = CachedAudio(target, size, time.time())
+        self.total_bytes += size
+        self.evict(keep=video_id)
+        return target
+
+    def discard(self, template):
+        """Remove whatever a failed or cancelled download left behind."""
+        prefix = Path(template).name.split('%')[0]
+        for leftover in self.incoming.glob(f"{prefix}*"):
+            self._remove_file(leftover)
+
+    def evict(self, keep=None):
+        """Drop least recently used files until the cache fits its budget."""
+        while self.total_bytes > self.max_bytes and self.entries:
+            video_id, entry = next(iter(self.entries.items()))
+            if video_id == keep:
+                if len(self.entries) == 1:
+                    break
+                self.entries.move_to_end(video_id)
+                continue
+
+            self.entries.pop(video_id)
+            self.total_bytes -= entry.size
+            self.evictions += 1
+            self._remove_file(entry.path)
+
+    def _remove_file(self, path):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove cached audio {path}: {e}")
+
+    def stats(self):
+        return {
+            'files': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,148 @@
+import logging
+import threading
+
+import discord
+
+logger = logging.getLogger('music_cog')
+
+# > Broadcast Streams <
+# When several guilds play the same track, one ffmpeg pipeline produces the
+# Opus frames and every guild reads them from a shared ring buffer at its
+# own offset. There is no producer thread: whichever reader is furthest
+# ahead pulls the next frame from ffmpeg, and the others replay it from the
+# buffer, so N listeners cost one ffmpeg process.
+
+FRAMES_PER_SECOND = 50  # discord.py sends one 20 ms Opus frame per read()
+
+
+class SharedStream:
+    """One ffmpeg pipeline whose frames are kept for several readers."""
+
+    def __init__(self, key, producer, capacity, on_close=None):
+        self.key = key
+        self.producer = producer
+        self.capacity = capacity  # frames kept in memory
+        self.on_close = on_close
+        self.frames = []
+        self.base = 0  # absolute index of frames[0]
+        self.finished = False
+        self.closed = False
+        self.readers = 0
+        self.lock = threading.Lock()
+        self.produce_lock = threading.Lock()
+
+    def try_attach(self):
+        """Add a reader if it can still start from the beginning of the track."""
+        with self.lock:
+            if self.closed or self.base != 0:
+                return False
+            self.readers += 1
+            return True
+
+    def frame(self, index):
+        """Return frame ``index`` (absolute), or b'' once the track has ended.
+
+        Readers that fell further behind than the buffer holds are moved up
+        to the oldest frame still available.
+        """
+        while True:
+            with self.lock:
+                if index < self.base:
+                    logger.warning(f"Broadcast reader for {self.key} fell behind by {self.base - index} frames")
+                    index = self.base
+                if index < self.base + len(self.frames):
+                    return self.frames[index - self.base], index
+                if self.finished or self.closed:
+                    return b'', index
+
+            # Only the reader at the head talks to ffmpeg; the rest keep
+            # reading buffered frames meanwhile
+            with self.produce_lock:
+                with self.lock:
+                    if index < self.base + len(self.frames) or self.finished or self.closed:
+                        continue
+                data = self.producer.read()
+                with self.lock:
+                    if not data:
+                        self.finished = True
+                        continue
+                    self.frames.append(data)
+                    overflow = len(self.frames) - self.capacity
+                    if overflow > 0:
+                        del self.frames[:overflow]
+                        self.base += overflow
+
+    def detach(self):
+        with self.lock:
+            self.readers -= 1
+            if self.readers > 0 or self.closed:
+                return
+            self.closed = True
+            self.frames = []
+        self.producer.cleanup()
+        if self.on_close is not None:
+            self.on_close(self)
+
+
+class BroadcastReader(discord.AudioSource):
+    """Per-guild view of a SharedStream."""
+
+    def __init__(self, stream):
+        self.stream = stream  # already attached by the hub
+        self.position = 0
+        self.detached = False
+
+    def read(self):
+        data, index = self.stream.frame(self.position)
+        self.position = index + 1 if data else index
+        return data
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        if not self.detached:
+            self.detached = True
+            self.stream.detach()
+
+
+class BroadcastHub:
+    """Shares running pipelines between guilds playing the same track."""
+
+    def __init__(self, buffer_seconds=300):
+        self.capacity = int(buffer_seconds * FRAMES_PER_SECOND)
+        self.streams = {}
+        self.lock = threading.Lock()
+        self.shared_joins = 0
+
+    def join(self, key):
+        """Return a reader on a running pipeline for ``key``, or None."""
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None or not stream.try_attach():
+                return None
+            self.shared_joins += 1
+            return BroadcastReader(stream)
+
+    def publish(self, key, producer, on_close=None):
+        """Wrap a new ffmpeg source so later guilds can join it."""
+        def closed(stream):
+            with self.lock:
+                if self.streams.get(key) is stream:
+                    del self.streams[key]
+            if on_close is not None:
+                on_close()
+
+        stream = SharedStream(key, producer, self.capacity, on_close=closed)
+        stream.readers = 1
+        with self.lock:
+            self.streams[key] = stream
+        return BroadcastReader(stream)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'streams': len(self.streams),
+                'listeners': sum(stream.readers for stream in self.streams.values()),
+                'shared_joins': self.shared_joins,
+            }
@@ -0,0 +1,203 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from cogs.music_support.router import normalize_query
+from cogs.music_support.track import EXPIRY_MARGIN, parse_stream_expiry
+
+logger = logging.getLogger('music_cog')
+
+# > Persistent Caches <
+# Small SQLite-backed key/value stores under .private/. Each table is bounded
+# by entry count with least-recently-used eviction, every entry carries its
+# own expiry, and hit/miss/eviction counters are kept in memory.
+
+
+class SQLiteLRUCache:
+    """Entry-bounded LRU cache of JSON values stored in one SQLite table."""
+
+    def __init__(self, path, table, max_entries=1000):
+        self.path = str(path)
+        self.table = table
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'expires_at REAL, last_access REAL NOT NULL)'
+        )
+        self.db.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_lru ON {self.table} (last_access)')
+        self.db.commit()
+        self.size = 0
+        self.purge_expired()
+        self.size = self.db.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def get(self, key):
+        """Return the cached value for ``key``, or None on a miss or expiry."""
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                f'SELECT value, expires_at FROM {self.table} WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self.db.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+                self.db.commit()
+                self.size -= 1
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.db.execute(f'UPDATE {self.table} SET last_access = ? WHERE key = ?', (now, key))
+            self.db.commit()
+            self.hits += 1
+
+        return json.loads(value)
+
+    def set(self, key, value, expires_at=None):
+        now = time.time()
+        with self.lock:
+            existed = self.db.execute(
+                f'SELECT 1 FROM {self.table} WHERE key = ?', (key,)
+            ).fetchone() is not None
+            self.db.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), expires_at, now)
+            )
+            if not existed:
+                self.size += 1
+
+            overflow = self.size - self.max_entries
+            if overflow > 0:
+                self.db.execute(
+                    f'DELETE FROM {self.table} WHERE key IN '
+                    f'(SELECT key FROM {self.table} ORDER BY last_access ASC LIMIT ?)',
+                    (overflow,)
+                )
+                self.size -= overflow
+                self.evictions += overflow
+            self.db.commit()
+
+    def delete(self, key):
+        with self.lock:
+            deleted = self.db.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,)).rowcount
+            self.db.commit()
+            self.size -= deleted
+
+    def purge_expired(self):
+        with self.lock:
+            purged = self.db.execute(
+                f'DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),)
+            ).rowcount
+            self.db.commit()
+            self.size -= purged
+            self.expirations += purged
+        return purged
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': self.size,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class StreamCache(SQLiteLRUCache):
+    """Resolved stream URLs keyed by ``extractor:id``.
+
+    Each entry lives until the URL's own ``expire=`` timestamp (minus a safety
+    margin), or ``default_ttl`` for URLs that do not carry one.
+    """
+
+    def __init__(self, path, max_entries=2000, default_ttl=3600):
+        super().__init__(path, 'streams', max_entries)
+        self.default_ttl = default_ttl
+
+    def get_stream(self, key):
+        return self.get(key)
+
+    def put_stream(self, key, stream_data):
+        expires_at = parse_stream_expiry(stream_data['url'], self.default_ttl) - EXPIRY_MARGIN
+        if expires_at <= time.time():
+            logger.warning(f"Not caching already expired stream for {key}")
+            return
+
+        self.set(key, {
+            'url': stream_data['url'],
+            'title': stream_data.get('title'),
+            'duration': stream_data.get('duration'),
+        }, expires_at)
+
+
+class SearchCache(SQLiteLRUCache):
+    """Formatted search results keyed by the normalized query."""
+
+    def __init__(self, path, max_entries=5000, ttl=6 * 3600):
+        super().__init__(path, 'searches', max_entries)
+        self.ttl = ttl
+
+    def get_results(self, query):
+        return self.get(normalize_query(query))
+
+    def put_results(self, query, results):
+        if results:
+            self.set(normalize_query(query), results, time.time() + self.ttl)
+
+
+class SpotifyCache(SQLiteLRUCache):
+    """Search query scraped for each Spotify track id.
+
+    Track titles do not change, so entries live much longer than searches.
+    """
+
+    def __init__(self, path, max_entries=5000, ttl=30 * 86400):
+        super().__init__(path, 'spotify_tracks', max_entries)
+        self.ttl = ttl
+
+    def get_query(self, track_id):
+        entry = self.get(track_id)
+        return entry['query'] if entry else None
+
+    def put_query(self, track_id, query):
+        self.set(track_id, {'query': query}, time.time() + self.ttl)
+
+
+class LoudnessIndex(SQLiteLRUCache):
+    """Measured loudness per track, keyed like the stream cache (``extractor:id``).
+
+    A track's loudness does not change, so entries never expire; only the
+    entry count bounds the table.
+    """
+
+    def __init__(self, path, max_entries=50000):
+        super().__init__(path, 'loudness', max_entries)
+
+    def get_loudness(self, key):
+        return self.get(key)
+
+    def put_loudness(self, key, measurement):
+        self.set(key, measurement)
@@ -0,0 +1,118 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+from cogs.music_support.track import parse_stream_expiry
+from cogs.music_support.ydl_pool import YoutubeDLPool, options_key
+
+logger = logging.getLogger('music_cog')
+
+# > Process Extraction Backend <
+# YouTube extraction is mostly pure Python (player JS interpretation for the
+# n/signature functions, big JSON documents, regexes), so in a thread it
+# holds the GIL against discord.py's event loop. With this backend enabled,
+# metadata extractions run in long-lived worker processes instead. Each
+# worker keeps its own warm YoutubeDLPool and sends back only the fields the
+# cog reads, so the full info dict (often hundreds of KB of formats) is
+# never pickled across the process boundary.
+#
+# Workers are spawned, not forked: the parent runs threads and an event loop
+# that a forked child must not inherit. Spawn still re-runs main.py in each
+# child (as __mp_main__), so discord.py is imported and a Bot object built
+# there, but main.py's __name__ guard keeps logging setup, cog loading and
+# the login out of it; workers never connect to Discord.
+
+INFO_FIELDS = ('id', 'title', 'duration', 'url', 'webpage_url', 'extractor_key', 'ie_key', '_type')
+ENTRY_FIELDS = ('id', 'title', 'duration', 'duration_string', 'url', 'ie_key')
+
+_pool = None  # The worker's own YoutubeDLPool
+
+
+def trim_info(info):
+    """The parts of a yt-dlp info dict the Music cog uses."""
+    if not info:
+        return info
+    trimmed = {field: info[field] for field in INFO_FIELDS if field in info}
+    if trimmed.get('url'):
+        trimmed['expires_at'] = parse_stream_expiry(trimmed['url'])
+    if info.get('entries') is not None:
+        trimmed['entries'] = [
+            {field: entry[field] for field in ENTRY_FIELDS if field in entry} if entry else None
+            for entry in info['entries']
+        ]
+    return trimmed
+
+
+def _init_worker(cache_dir, opts):
+    global _pool
+    _pool = YoutubeDLPool(cache_dir)
+    try:
+        _pool.warm(opts)
+    except Exception as e:
+        # A failing initializer would break the whole executor; extract cold instead
+        logger.warning(f"Warming yt-dlp in extraction worker failed: {e}")
+
+
+def _extract(url, opts):
+    with _pool.instance(opts) as ydl:
+        return trim_info(ydl.extract_info(url, download=False))
+
+
+class ProcessExtractor:
+    """Runs metadata extractions on a pool of long-lived worker processes."""
+
+    def __init__(self, processes, cache_dir, opts):
+        self.processes = processes
+        self.initargs = (str(cache_dir), opts)
+        self.lock = threading.Lock()
+        self.restarts = 0
+        self.executor = self._create_executor()
+
+    def _create_executor(self):
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=self.initargs
+        )
+
+    def _replace_broken(self, executor):
+        """Swap in a fresh pool after a worker died; only the first caller rebuilds it."""
+        with self.lock:
+            if self.executor is executor:
+                self.restarts += 1
+                logger.warning("An extraction worker process died, restarting the process pool")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = self._create_executor()
+            return self.executor
+
+    @staticmethod
+    def supports(opts, download):
+        """Downloads and option sets with callables stay on the thread backend."""
+        return not download and options_key(opts) is not None
+
+    def extract(self, url, opts, timeout=None):
+        """Blocking; meant to be called from a resolver worker thread.
+
+        A worker that died (OOM, segfault) breaks the whole executor, so the
+        pool is rebuilt and the extraction retried once on the new one.
+        """
+        executor = self.executor
+        for attempt in range(2):
+            try:
+                future = executor.submit(_extract, url, opts)
+                try:
+                    return future.result(timeout)
+                except concurrent.futures.TimeoutError:
+                    future.cancel()
+                    raise
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                executor = self._replace_broken(executor)
+
+    def shutdown(self):
+        with self.lock:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger('music_cog')
+
+# > Hedged Resolution <
+# Instead of walking the fallback resolvers one after another, start them
+# concurrently (optionally staggered by a hedge delay) and keep whichever
+# returns a valid result first. The losers are cancelled.
+
+
+async def _first_valid(pending, names, validate, timeout=None):
+    """Wait for the first task in ``pending`` whose result passes ``validate``.
+
+    Returns ``(name, result)`` or ``None`` if nothing valid arrived before the
+    timeout or every task finished without a usable result.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+
+    while pending:
+        remaining = None if deadline is None else max(0.0, deadline - loop.time())
+        done, _ = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            return None
+
+        for task in done:
+            pending.discard(task)
+            if task.cancelled():
+                continue
+
+            error = task.exception()
+            if error is not None:
+                logger.warning(f"Hedged resolver {names[task]} failed: {error}")
+                continue
+
+            result = validate(task.result())
+            if result:
+                return names[task], result
+
+    return None
+
+
+async def hedged_race(candidates, validate, hedge_delay=0.0):
+    """Race ``candidates`` and return ``(name, result, elapsed)`` for the winner.
+
+    ``candidates`` is a list of ``(name, factory)`` pairs where ``factory()``
+    returns an awaitable. With a ``hedge_delay`` of 0 every candidate starts at
+    once; otherwise the next one starts only when the previous ones have had
+    ``hedge_delay`` seconds without producing a valid result (or all failed).
+    ``result`` is whatever ``validate`` returned for the winning value. When no
+    candidate succeeds, ``name`` and ``result`` are ``None``.
+    """
+    started = time.monotonic()
+    names = {}
+    pending = set()
+
+    try:
+        for index, (name, factory) in enumerate(candidates):
+            task = asyncio.ensure_future(factory())
+            names[task] = name
+            pending.add(task)
+
+            is_last = index == len(candidates) - 1
+            if hedge_delay > 0 and not is_last:
+                winner = await _first_valid(pending, names, validate, timeout=hedge_delay)
+                if winner:
+                    return winner[0], winner[1], time.monotonic() - started
+
+        winner = await _first_valid(pending, names, validate)
+        if winner:
+            return winner[0], winner[1], time.monotonic() - started
+        return None, None, time.monotonic() - started
+    finally:
+        for task in pending:
+            task.cancel()
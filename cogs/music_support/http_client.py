@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import aiohttp
+
+# > Pooled HTTP Client <
+# One long-lived aiohttp session shared by every stream/search resolver.
+# Connections to each Piped/Invidious host are kept alive between calls and
+# DNS answers are cached, so a fallback attempt no longer pays a fresh TCP +
+# TLS handshake, and nothing blocks the event loop while a mirror is slow.
+
+
+class HTTPResponse:
+    """Fully read response body, detached from the underlying connection."""
+
+    def __init__(self, status, headers, body, url):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.url = url
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class HTTPClient:
+    """Shared aiohttp session with keep-alive pooling and strict deadlines."""
+
+    def __init__(self, connect_timeout=3.0, read_timeout=7.0, total_timeout=10.0,
+                 limit=64, limit_per_host=4, dns_ttl=300, headers=None):
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout,
+            connect=connect_timeout,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.headers = headers or {}
+        self.session = None
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        async with self._lock:
+            if self.session is None or self.session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=self.dns_ttl,
+                    use_dns_cache=True,
+                    keepalive_timeout=60
+                )
+                self.session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=self.timeout,
+                    headers=self.headers
+                )
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def get(self, url, headers=None, timeout=None):
+        """GET ``url`` and return an ``HTTPResponse`` with the body already read.
+
+        Raises ``aiohttp.ClientError`` or ``asyncio.TimeoutError`` on failure.
+        """
+        session = self.session
+        if session is None or session.closed:
+            session = await self.start()
+
+        async with session.get(url, headers=headers, timeout=timeout or self.timeout) as response:
+            body = await response.read()
+            return HTTPResponse(response.status, response.headers, body, str(response.url))
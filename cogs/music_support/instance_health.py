@@ -0,0 +1,229 @@
+import json
+import logging
+import time
+import urllib.parse
+
+logger = logging.getLogger('music_cog')
+
+# > Instance Health Registry <
+# Keeps an EWMA of latency and success rate for every Piped/Invidious mirror
+# so the fast, healthy ones are tried first. A mirror that keeps failing trips
+# a circuit breaker: it is skipped until its cooldown expires, then a single
+# half-open probe decides whether it comes back or stays open for longer.
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class MirrorError(Exception):
+    """A mirror answer that says the mirror itself is unhealthy."""
+
+
+def mirror_payload(response):
+    """JSON object of a mirror response, or None when only the video is unavailable.
+
+    Raises MirrorError for 5xx and rate limiting and ValueError for malformed
+    bodies; a well-formed 4xx (deleted, private, region-locked video) is the
+    video's problem and must not count against the mirror.
+    """
+    if response.status >= 500 or response.status == 429:
+        raise MirrorError(f"HTTP {response.status}")
+    if response.status != 200:
+        return None
+    data = response.json()
+    if not isinstance(data, dict):
+        raise ValueError(f"expected a JSON object, got {type(data).__name__}")
+    return data
+
+
+class InstanceHealth:
+    """Rolling health statistics for a single mirror."""
+
+    def __init__(self, url, kind):
+        self.url = url
+        self.kind = kind
+        self.latency = None  # EWMA, seconds
+        self.success_rate = 1.0  # EWMA of 1 (success) / 0 (failure)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure = None
+        self.last_success = None
+        self.trips = 0
+        self.open_until = 0.0
+        self.probe_started = None
+
+    @property
+    def host(self):
+        return urllib.parse.urlparse(self.url).netloc or self.url
+
+    def state(self, now=None):
+        now = now or time.time()
+        if self.open_until == 0.0:
+            return CLOSED
+        if now < self.open_until:
+            return OPEN
+        return HALF_OPEN
+
+    def score(self, default_latency):
+        """Expected cost of trying this mirror; lower is better."""
+        latency = self.latency if self.latency is not None else default_latency
+        return latency / max(self.success_rate, 0.05)
+
+    def to_dict(self):
+        return {
+            'kind': self.kind,
+            'latency': self.latency,
+            'success_rate': self.success_rate,
+            'successes': self.successes,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'last_failure': self.last_failure,
+            'last_success': self.last_success,
+            'trips': self.trips,
+            'open_until': self.open_until,
+        }
+
+    @classmethod
+    def from_dict(cls, url, data):
+        health = cls(url, data.get('kind', 'unknown'))
+        for field in ('latency', 'success_rate', 'successes', 'failures', 'consecutive_failures',
+                      'last_failure', 'last_success', 'trips', 'open_until'):
+            if field in data:
+                setattr(health, field, data[field])
+        return health
+
+
+class InstanceHealthRegistry:
+    """Scores mirrors, orders them for each lookup and persists the result."""
+
+    def __init__(self, path, alpha=0.3, failure_threshold=3, cooldown=120.0,
+                 max_cooldown=3600.0, probe_timeout=30.0, default_latency=1.0):
+        self.path = path
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+        self.default_latency = default_latency
+        self.instances = {}
+        self.dirty = False
+        self.load()
+
+    def register(self, kind, urls):
+        """Track exactly ``urls`` for ``kind``, keeping any restored state."""
+        urls = [url.rstrip('/') for url in urls]
+        for url in [url for url, health in self.instances.items() if health.kind == kind and url not in urls]:
+            del self.instances[url]
+
+        for url in urls:
+            health = self.instances.get(url)
+            if health is None:
+                self.instances[url] = InstanceHealth(url, kind)
+            else:
+                health.kind = kind
+
+    def ordered(self, kind, limit=None):
+        """Return up to ``limit`` usable mirrors of ``kind``, best score first.
+
+        Open circuits are skipped. Mirrors whose cooldown expired are appended
+        last as half-open probes, one probe at a time per mirror.
+        """
+        now = time.time()
+        healthy = []
+        probes = []
+        for health in self.instances.values():
+            if health.kind != kind:
+                continue
+
+            state = health.state(now)
+            if state == CLOSED:
+                healthy.append(health)
+            elif state == HALF_OPEN:
+                if health.probe_started is None or now - health.probe_started > self.probe_timeout:
+                    probes.append(health)
+
+        healthy.sort(key=lambda health: health.score(self.default_latency))
+        selected = (healthy + probes)[:limit]
+        for health in selected:
+            if health in probes:
+                health.probe_started = now
+        return [health.url for health in selected]
+
+    def _get(self, url):
+        url = url.rstrip('/')
+        health = self.instances.get(url)
+        if health is None:
+            health = InstanceHealth(url, 'unknown')
+            self.instances[url] = health
+        return health
+
+    def record_success(self, url, latency):
+        health = self._get(url)
+        now = time.time()
+        if health.latency is None:
+            health.latency = latency
+        else:
+            health.latency = self.alpha * latency + (1 - self.alpha) * health.latency
+        health.success_rate = self.alpha + (1 - self.alpha) * health.success_rate
+        health.successes += 1
+        health.consecutive_failures = 0
+        health.last_success = now
+        if health.open_until:
+            logger.info(f"Instance {health.url} recovered, closing its circuit")
+        health.open_until = 0.0
+        health.trips = 0
+        health.probe_started = None
+        self.dirty = True
+
+    def record_failure(self, url, latency=None):
+        health = self._get(url)
+        now = time.time()
+        if latency is not None:
+            # Slow failures (timeouts) should also push the mirror down the list
+            if health.latency is None:
+                health.latency = latency
+            else:
+                health.latency = self.alpha * latency + (1 - self.alpha) * health.latency
+        health.success_rate = (1 - self.alpha) * health.success_rate
+        health.failures += 1
+        health.consecutive_failures += 1
+        health.last_failure = now
+
+        state = health.state(now)
+        if state == HALF_OPEN or (state == CLOSED and health.consecutive_failures >= self.failure_threshold):
+            health.trips += 1
+            cooldown = min(self.cooldown * 2 ** (health.trips - 1), self.max_cooldown)
+            health.open_until = now + cooldown
+            logger.warning(f"Circuit opened for {health.url} for {cooldown:.0f}s "
+                           f"after {health.consecutive_failures} consecutive failures")
+        health.probe_started = None
+        self.dirty = True
+
+    def snapshot(self, kind=None):
+        """Health entries ordered by score, optionally filtered by kind."""
+        entries = [health for health in self.instances.values() if kind is None or health.kind == kind]
+        return sorted(entries, key=lambda health: (health.kind, health.state() != CLOSED,
+                                                   health.score(self.default_latency)))
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.instances = {url: InstanceHealth.from_dict(url, entry) for url, entry in data.items()}
+        except FileNotFoundError:
+            self.instances = {}
+        except Exception as e:
+            logger.error(f"Error loading instance health: {e}")
+            self.instances = {}
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            with open(self.path, 'w') as f:
+                json.dump({url: health.to_dict() for url, health in self.instances.items()}, f, indent=4)
+            self.dirty = False
+        except Exception as e:
+            logger.error(f"Error saving instance health: {e}")
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import math
+import re
+
+logger = logging.getLogger('music_cog')
+
+# > Loudness Normalization <
+# Live two-pass loudnorm would decode every track twice on every play.
+# Instead each track is measured once (EBU R128 integrated loudness and true
+# peak, via ffmpeg's ebur128 filter) in the background, and the result is
+# kept in the LoudnessIndex. Later plays add a plain ``volume`` filter with
+# the gain that brings the track to the target, capped so the true peak
+# stays below the ceiling. Scaling samples is practically free next to the
+# decode and Opus encode the pipeline does anyway.
+
+TARGET_LUFS = -14.0  # Integrated loudness every track is brought to
+PEAK_CEILING = -1.0  # dBTP the gain may not push the true peak above
+MAX_BOOST = 12.0  # dB; quiet tracks are not amplified further than this
+MAX_CUT = 20.0  # dB
+MIN_GAIN = 0.5  # dB; smaller corrections are not worth a filter
+MAX_MEASURE_SECONDS = 1800  # Longer tracks (and live streams) are never measured
+
+_integrated_pattern = re.compile(r'I:\s+(-?[\d.]+|-inf) LUFS')
+_peak_pattern = re.compile(r'Peak:\s+(-?[\d.]+|-inf) dBFS')
+_range_pattern = re.compile(r'LRA:\s+(-?[\d.]+) LU')
+
+
+def parse_ebur128_summary(output):
+    """Pull integrated loudness, true peak and loudness range out of ffmpeg's log.
+
+    The summary comes last, so the last match of each value wins.
+    """
+    integrated = _integrated_pattern.findall(output)
+    peak = _peak_pattern.findall(output)
+    if not integrated or not peak:
+        return None
+    loudness_range = _range_pattern.findall(output)
+    return {
+        'integrated': float(integrated[-1]),
+        'peak': float(peak[-1]),
+        'lra': float(loudness_range[-1]) if loudness_range else None,
+    }
+
+
+def gain_for(measurement, target=TARGET_LUFS):
+    """Gain in dB that normalizes a measured track, 0.0 if none is needed."""
+    if not measurement:
+        return 0.0
+    integrated = measurement.get('integrated')
+    if integrated is None or not math.isfinite(integrated):
+        return 0.0  # Silence
+
+    gain = target - integrated
+    peak = measurement.get('peak')
+    if peak is not None and math.isfinite(peak):
+        gain = min(gain, PEAK_CEILING - peak)
+    gain = max(-MAX_CUT, min(gain, MAX_BOOST))
+    return gain if abs(gain) >= MIN_GAIN else 0.0
+
+
+def with_gain(options, gain_db):
+    """Copy of ffmpeg options with a volume filter at the head of the -af chain."""
+    if not gain_db:
+        return options
+    options = dict(options)
+    volume = f"volume={gain_db:.2f}dB"
+    current = options.get('options', '')
+    if '-af ' in current:
+        options['options'] = current.replace('-af ', f'-af {volume},', 1)
+    else:
+        options['options'] = f"{current} -af {volume}".strip()
+    return options
+
+
+async def measure_loudness(url, is_local=False, timeout=600, executable='ffmpeg'):
+    """Run one ebur128 analysis pass over ``url``; returns the measurement or None."""
+    args = [executable, '-nostdin', '-hide_banner', '-nostats']
+    if not is_local:
+        args += ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5']
+    args += [
+        '-t', str(MAX_MEASURE_SECONDS), '-i', url, '-vn',
+        '-af', 'ebur128=peak=true:framelog=verbose', '-f', 'null', '-'
+    ]
+
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        process.kill()
+        await process.wait()
+        raise
+
+    output = stderr.decode('utf-8', errors='replace')
+    if process.returncode != 0:
+        logger.warning(f"Loudness measurement exited with {process.returncode}: {output[-300:]}")
+        return None
+    return parse_ebur128_summary(output)
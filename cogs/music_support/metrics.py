@@ -0,0 +1,153 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# > Playback Metrics <
+# Latency histograms for the %play pipeline. Every stage (voice connect,
+# cache lookups, yt-dlp, each fallback resolver, ffmpeg spawn, first packet)
+# is timed into a histogram of its own, and time-to-first-audio (from the
+# moment a track starts being set up to the first Opus frame leaving for
+# Discord) is kept per stream source and per guild. Histograms use fixed
+# Prometheus-style buckets, so memory stays constant however long the bot
+# runs, and quantiles are interpolated from the buckets much like
+# Prometheus' histogram_quantile() does.
+
+# Upper bounds in seconds; everything slower lands in the implicit +Inf bucket
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Estimate the ``q`` quantile, or None without observations."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                # Never report more than was actually observed
+                upper = min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+class PlaybackMetrics:
+    """Stage and time-to-first-audio histograms shared by the whole cog.
+
+    Observations come from the event loop and from discord.py's audio
+    thread, so every histogram update happens under one lock.
+    """
+
+    def __init__(self):
+        self.stages = {}  # stage -> Histogram
+        self.ttfa_by_source = {}  # stream source -> Histogram
+        self.ttfa_by_guild = {}  # guild id -> Histogram
+        self.ttfa = Histogram()
+        self.lock = threading.Lock()
+
+    def observe_stage(self, stage, seconds):
+        with self.lock:
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+
+    @contextmanager
+    def stage(self, stage):
+        """Time the body of a ``with`` block into ``stage``, even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - started)
+
+    def observe_ttfa(self, source, guild_id, seconds):
+        with self.lock:
+            self.ttfa.observe(seconds)
+            self.ttfa_by_source.setdefault(source, Histogram()).observe(seconds)
+            self.ttfa_by_guild.setdefault(guild_id, Histogram()).observe(seconds)
+
+    def forget_guild(self, guild_id):
+        with self.lock:
+            self.ttfa_by_guild.pop(guild_id, None)
+
+    def snapshot(self):
+        """Summaries of every histogram, for %musicstats."""
+        with self.lock:
+            return {
+                'ttfa': self.ttfa.summary(),
+                'sources': {name: h.summary() for name, h in self.ttfa_by_source.items()},
+                'guilds': {guild_id: h.summary() for guild_id, h in self.ttfa_by_guild.items()},
+                'stages': {name: h.summary() for name, h in self.stages.items()},
+            }
+
+    def render_prometheus(self):
+        """All histograms in the Prometheus text exposition format."""
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in series:
+                label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+                cumulative = 0
+                for bound, count in zip(h.buckets + ('+Inf',), h.counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else f"{bound:g}"
+                    prefix = f'{label_text},' if label_text else ''
+                    lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+                suffix = f'{{{label_text}}}' if label_text else ''
+                lines.append(f"{name}_sum{suffix} {h.sum:.6f}")
+                lines.append(f"{name}_count{suffix} {h.count}")
+
+        with self.lock:
+            histogram(
+                'music_stage_seconds', 'Time spent in each playback setup stage.',
+                [((('stage', name),), h) for name, h in sorted(self.stages.items())]
+            )
+            histogram(
+                'music_time_to_first_audio_seconds', 'Track setup to first Opus frame, by stream source.',
+                [((('source', name),), h) for name, h in sorted(self.ttfa_by_source.items())]
+            )
+            histogram(
+                'music_guild_time_to_first_audio_seconds', 'Track setup to first Opus frame, by guild.',
+                [((('guild', guild_id),), h) for guild_id, h in sorted(self.ttfa_by_guild.items())]
+            )
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Write the exposition atomically, for node_exporter's textfile collector."""
+        path = str(path)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(self.render_prometheus())
+        os.replace(temp_path, path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,71 @@
+import asyncio
+import time
+from collections import deque
+
+# > Guild Player State <
+# Everything the cog tracks for one guild lives on a single GuildPlayer,
+# created on first use and dropped as a whole when the bot leaves the
+# guild's voice channel, so no per-guild entries are left behind.
+#
+# Each player is driven by one long-lived asyncio task that reads messages
+# from ``messages``. Commands and discord.py's audio thread only post
+# messages; the task owns every track transition and runs it as a separate,
+# cancellable task, so the audio thread never waits on a resolution.
+
+# Player task messages, posted as (kind, payload) tuples
+ADVANCE = 'advance'  # Start the next track if nothing is playing
+FINISHED = 'finished'  # The audio thread finished playing ``payload``
+SKIP = 'skip'  # Abandon the current track or transition, play the next one
+STOP = 'stop'  # Abandon everything and clear the queue
+
+
+class GuildPlayer:
+    """Playback state for one guild."""
+
+    __slots__ = (
+        'guild_id', 'voice_client', 'channel', 'queue', 'current', 'source', 'loop',
+        'track_started', 'recoveries', 'prefetch_task', 'messages', 'task', 'transition', 'last_active',
+        'alone_since', 'generation'
+    )
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.voice_client = None
+        self.channel = None  # Text channel that receives "Now Playing" and errors
+        self.queue = deque()
+        self.current = None  # Track being played
+        self.source = None  # AudioSource handed to the voice client
+        self.loop = False
+        self.track_started = None  # wall time the current track started
+        self.recoveries = 0  # Times the current track was reopened after dying early
+        self.prefetch_task = None
+        self.messages = asyncio.Queue()
+        self.task = None  # Long-lived player task
+        self.transition = None  # Task resolving and starting the next track
+        self.last_active = time.monotonic()  # Last command or audio activity
+        self.alone_since = None  # When the voice channel was last seen without listeners
+        self.generation = 0  # Bumped by stop/leave so in-flight enqueues can tell they are stale
+
+    @property
+    def busy(self):
+        """True while a track is playing, paused or being started."""
+        return self.source is not None or (self.transition is not None and not self.transition.done())
+
+    def post(self, kind, payload=None):
+        self.messages.put_nowait((kind, payload))
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def next_track(self):
+        """Pop the head of the queue, or None when it is empty."""
+        return self.queue.popleft() if self.queue else None
+
+    def clear(self):
+        """Forget the queue and the current track (stop/leave)."""
+        self.queue.clear()
+        self.current = None
+        self.source = None
+        self.loop = False
+        self.track_started = None
+        self.generation += 1
@@ -0,0 +1,69 @@
+import discord
+
+# > Mid-Track Recovery <
+# Every source handed to a voice client is wrapped so the player knows how
+# far into the track playback got. When ffmpeg stops well before the track's
+# duration (an expired googlevideo URL answering 403, a dropped connection,
+# a voice reconnect that outlived the HTTP stream) the player re-resolves a
+# fresh URL and reopens ffmpeg with an input seek to that position.
+
+FRAME_SECONDS = 0.02  # discord.py reads one 20 ms Opus frame at a time
+END_TOLERANCE = 3.0  # Ending this close to the known duration counts as finished
+MAX_RECOVERIES = 3  # Per track, so a stream that keeps dying is given up on
+
+
+def seek_options(options, start_at):
+    """Copy of ffmpeg options with an input seek to ``start_at`` seconds."""
+    if not start_at:
+        return options
+    options = dict(options)
+    options['before_options'] = f"-ss {start_at:.2f} {options.get('before_options', '')}".strip()
+    return options
+
+
+class TrackedSource(discord.AudioSource):
+    """Counts the frames a voice client has played from the wrapped source.
+
+    ``on_start`` is called (on the audio thread) when the first frame is read.
+    """
+
+    def __init__(self, source, start_at=0.0, on_start=None):
+        self.source = source
+        self.start_at = start_at
+        self.on_start = on_start
+        self.frames = 0
+
+    @property
+    def position(self):
+        """Seconds into the track, including the seek it was opened with."""
+        return self.start_at + self.frames * FRAME_SECONDS
+
+    def read(self):
+        data = self.source.read()
+        if data:
+            if not self.frames and self.on_start is not None:
+                self.on_start()
+            self.frames += 1
+        return data
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
+
+def resume_position(track, source, recoveries):
+    """Where to reopen ``track`` after ``source`` ended, or None if it just finished.
+
+    A source that died before its first frame (e.g. a URL answering 403
+    straight away) is reopened where it started; every reopen counts
+    towards MAX_RECOVERIES, so a track that never plays is given up on.
+    """
+    if track is None or not track.duration or not isinstance(source, TrackedSource):
+        return None
+    if recoveries >= MAX_RECOVERIES:
+        return None
+    if source.position >= track.duration - END_TOLERANCE:
+        return None
+    return source.position
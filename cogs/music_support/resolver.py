@@ -0,0 +1,271 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+
+from cogs.music_support.scheduler import PRIORITY_CURRENT, PRIORITY_PREFETCH, SchedulerSaturated
+
+logger = logging.getLogger('music_cog')
+
+# > Resolver Worker Pool <
+# yt-dlp is fully synchronous, so every extraction and download runs in a
+# bounded thread pool. Coroutines only await the result, which keeps the
+# gateway heartbeat and the other cogs responsive while a slow extraction runs.
+# An optional ResourceScheduler decides which job gets a worker next.
+
+_worker_state = threading.local()
+
+
+class ResolverCancelled(Exception):
+    """Raised when a resolver job is cancelled before it could finish."""
+
+
+def check_cancelled():
+    """Abort the current worker job if it was cancelled.
+
+    Meant to be called from inside a worker, e.g. as a yt-dlp progress hook,
+    so long downloads stop as soon as the user skips or leaves.
+    """
+    job = getattr(_worker_state, 'job', None)
+    if job is not None and job.cancelled.is_set():
+        raise ResolverCancelled(f"Resolver job '{job.label}' was cancelled")
+
+
+class ResolverJob:
+    """Book-keeping for one piece of work submitted to the pool."""
+
+    def __init__(self, guild_id, label, background=False):
+        self.guild_id = guild_id
+        self.label = label
+        self.background = background
+        self.cancelled = threading.Event()
+        self.submitted_at = time.monotonic()
+        self.future = None
+        self.waiter = None
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_exception(ResolverCancelled(f"Resolver job '{self.label}' was cancelled"))
+            # The awaiting task may itself be cancelled (skip/stop) and never read it
+            self.waiter.exception()
+
+
+class ResolverPool:
+    """Runs blocking resolver work on a bounded pool of worker threads."""
+
+    def __init__(self, max_workers=4, timeout=45.0, scheduler=None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='music-resolver'
+        )
+        self.jobs = set()
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self):
+        """Number of jobs waiting for a free worker."""
+        return self.queued
+
+    def stats(self):
+        with self.lock:
+            return {
+                'workers': self.max_workers,
+                'queued': self.queued,
+                'active': self.active,
+                'completed': self.completed,
+                'failed': self.failed,
+                'timed_out': self.timed_out,
+                'cancelled': self.cancelled,
+                'rejected': self.rejected,
+            }
+
+    def _run_job(self, job, func, args, kwargs):
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+
+        _worker_state.job = job
+        try:
+            check_cancelled()
+            return func(*args, **kwargs)
+        finally:
+            _worker_state.job = None
+            with self.lock:
+                self.active -= 1
+
+    def _deliver(self, job, future):
+        """Copy the worker result onto the asyncio waiter (runs on the loop)."""
+        if job.waiter.done():
+            return
+
+        if future.cancelled():
+            job.waiter.set_exception(ResolverCancelled(f"Resolver job '{job.label}' was cancelled"))
+            return
+
+        error = future.exception()
+        if error is not None:
+            job.waiter.set_exception(error)
+        else:
+            job.waiter.set_result(future.result())
+
+    async def _admit(self, job, priority, timeout):
+        """Wait for a scheduler slot, unless the job is cancelled or times out first."""
+        admission = asyncio.ensure_future(self.scheduler.acquire(job.guild_id, priority))
+        try:
+            await asyncio.wait({admission, job.waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            admission.cancel()
+            raise
+        finally:
+            if not admission.done():
+                admission.cancel()
+
+        if admission.cancelled() or not admission.done():
+            if job.waiter.done():
+                job.waiter.result()  # Raises ResolverCancelled
+            raise asyncio.TimeoutError()
+        admission.result()  # Raises SchedulerSaturated
+
+    async def run(self, func, *args, guild_id=None, timeout=None, label=None, background=False,
+                  priority=None, **kwargs):
+        """Run ``func(*args, **kwargs)`` in the pool and await its result.
+
+        Raises ``asyncio.TimeoutError`` when the job exceeds its deadline,
+        ``ResolverCancelled`` when it is cancelled through ``cancel_guild``
+        and ``SchedulerSaturated`` when the scheduler turns it away.
+        ``background`` marks speculative work (e.g. prefetch) that a skip
+        should leave alone; ``priority`` defaults to prefetch priority for
+        background jobs and current-track priority otherwise.
+        """
+        loop = asyncio.get_running_loop()
+        timeout = timeout or self.timeout
+        # Time spent waiting for a slot counts against the same budget
+        deadline = loop.time() + timeout
+        job = ResolverJob(guild_id, label or getattr(func, '__name__', 'job'), background)
+        job.waiter = loop.create_future()
+        if priority is None:
+            priority = PRIORITY_PREFETCH if background else PRIORITY_CURRENT
+
+        # Registered before admission so cancel_guild reaches waiting jobs too
+        self.jobs.add(job)
+        admitted = False
+        try:
+            if self.scheduler is not None:
+                try:
+                    await self._admit(job, priority, timeout)
+                except SchedulerSaturated:
+                    self.rejected += 1
+                    logger.warning(f"Resolver job '{job.label}' rejected: scheduler saturated")
+                    raise
+                except asyncio.TimeoutError:
+                    self.timed_out += 1
+                    logger.error(f"Resolver job '{job.label}' waited more than {timeout}s for a slot")
+                    raise
+                except ResolverCancelled:
+                    self.cancelled += 1
+                    raise
+                admitted = True
+
+            return await self._submit(loop, job, func, args, kwargs, timeout, deadline)
+        finally:
+            self.jobs.discard(job)
+            if admitted:
+                self.scheduler.release(guild_id)
+
+    async def _submit(self, loop, job, func, args, kwargs, timeout, deadline):
+        with self.lock:
+            self.queued += 1
+            backlog = self.queued
+        if backlog > self.max_workers:
+            logger.warning(f"Resolver backlog is {backlog} jobs deep ({self.max_workers} workers)")
+
+        try:
+            job.future = self.executor.submit(self._run_job, job, func, args, kwargs)
+        except RuntimeError:
+            with self.lock:
+                self.queued -= 1
+            raise
+
+        def on_done(future):
+            if future.cancelled():
+                # The job never reached a worker, so _run_job did not count it.
+                with self.lock:
+                    self.queued -= 1
+            try:
+                loop.call_soon_threadsafe(self._deliver, job, future)
+            except RuntimeError:
+                pass  # Event loop already closed
+
+        job.future.add_done_callback(on_done)
+
+        try:
+            result = await asyncio.wait_for(job.waiter, max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            job.cancel()
+            self.timed_out += 1
+            logger.error(f"Resolver job '{job.label}' timed out after {timeout}s")
+            raise
+        except ResolverCancelled:
+            self.cancelled += 1
+            raise
+        except asyncio.CancelledError:
+            job.cancel()
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+
+        self.completed += 1
+        return result
+
+    def guild_jobs(self, guild_id, include_background=True):
+        return [
+            job for job in self.jobs
+            if job.guild_id == guild_id and (include_background or not job.background)
+        ]
+
+    def cancel_guild(self, guild_id, include_background=True):
+        """Cancel every pending or running job that belongs to a guild."""
+        jobs = self.guild_jobs(guild_id, include_background)
+        for job in jobs:
+            job.cancel()
+        return len(jobs)
+
+    def prime(self, func, *args):
+        """Run ``func(*args)`` once on every worker thread, e.g. to build per-thread state.
+
+        The calls wait for each other so each lands on its own thread.
+        Returns the concurrent futures.
+        """
+        barrier = threading.Barrier(self.max_workers)
+
+        def run():
+            try:
+                func(*args)
+            finally:
+                try:
+                    barrier.wait(timeout=30)
+                except threading.BrokenBarrierError:
+                    pass
+
+        return [self.executor.submit(run) for _ in range(self.max_workers)]
+
+    def shutdown(self):
+        for job in list(self.jobs):
+            job.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,156 @@
+import re
+import urllib.parse
+
+# > Source Router <
+# Every %play query is classified exactly once: YouTube video, YouTube
+# playlist/mix, Spotify track, any other URL (handed to yt-dlp) or free
+# search text. Dispatch is on the parsed host and path rather than a
+# cascade of regexes, and each route carries the normalized key the caches
+# use, so two spellings of the same video share one cache entry.
+
+SEARCH = 'search'
+YOUTUBE_VIDEO = 'youtube_video'
+YOUTUBE_PLAYLIST = 'youtube_playlist'
+SPOTIFY_TRACK = 'spotify_track'
+URL = 'url'
+
+YOUTUBE_HOSTS = frozenset((
+    'youtube.com', 'www.youtube.com', 'm.youtube.com', 'music.youtube.com',
+    'youtube-nocookie.com', 'www.youtube-nocookie.com',
+))
+YOUTU_BE_HOSTS = frozenset(('youtu.be', 'www.youtu.be'))
+SPOTIFY_HOSTS = frozenset(('open.spotify.com', 'play.spotify.com'))
+
+# Path prefixes whose next segment is a video id, e.g. /shorts/<id>
+YOUTUBE_ID_PATHS = frozenset(('embed', 'v', 'e', 'shorts', 'live'))
+
+_VIDEO_ID = re.compile(r'[A-Za-z0-9_-]{11}')
+_PLAYLIST_ID = re.compile(r'[A-Za-z0-9_-]+')
+_SPOTIFY_ID = re.compile(r'[A-Za-z0-9]{22}')
+_SPOTIFY_URI = re.compile(r'spotify:track:([A-Za-z0-9]{22})')
+_URL = re.compile(
+    r'(?:http|ftp)s?://'
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+(?:[A-Z]{2,6}\.?|[A-Z0-9-]{2,}\.?)|'
+    r'localhost|'
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'
+    r'(?::\d+)?'
+    r'(?:/?|[/?]\S+)',
+    re.IGNORECASE
+)
+# Scheme-less links people paste, e.g. "youtu.be/dQw4w9WgXcQ"
+_BARE_KNOWN_HOST = re.compile(
+    r'(?:(?:www|m|music)\.)?(?:youtube\.com|youtu\.be|youtube-nocookie\.com)/\S+'
+    r'|(?:open|play)\.spotify\.com/\S+',
+    re.IGNORECASE
+)
+
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a search query."""
+    return ' '.join(query.casefold().split())
+
+
+class Route:
+    """What a query points at, and the key every cache stores it under."""
+
+    __slots__ = ('kind', 'query', 'video_id', 'playlist_id', 'spotify_id')
+
+    def __init__(self, kind, query, video_id=None, playlist_id=None, spotify_id=None):
+        self.kind = kind
+        self.query = query
+        self.video_id = video_id
+        self.playlist_id = playlist_id
+        self.spotify_id = spotify_id
+
+    @property
+    def is_url(self):
+        return self.kind != SEARCH
+
+    @property
+    def is_youtube(self):
+        return self.kind in (YOUTUBE_VIDEO, YOUTUBE_PLAYLIST)
+
+    @property
+    def url(self):
+        """Canonical URL for YouTube routes, the query itself otherwise."""
+        if self.kind == YOUTUBE_PLAYLIST:
+            return f"https://www.youtube.com/playlist?list={self.playlist_id}"
+        if self.kind == YOUTUBE_VIDEO:
+            return f"https://www.youtube.com/watch?v={self.video_id}"
+        return self.query
+
+    @property
+    def key(self):
+        if self.kind == YOUTUBE_VIDEO:
+            return f"youtube:{self.video_id}"
+        if self.kind == YOUTUBE_PLAYLIST:
+            return f"youtube-playlist:{self.playlist_id}"
+        if self.kind == SPOTIFY_TRACK:
+            return f"spotify:{self.spotify_id}"
+        if self.kind == SEARCH:
+            return normalize_query(self.query)
+        # Any other URL: host and path, without query string or fragment
+        parsed = urllib.parse.urlsplit(self.query)
+        return f"{parsed.netloc.lower()}{parsed.path}".rstrip('/')
+
+    def __repr__(self):
+        return f"Route({self.kind!r}, {self.key!r})"
+
+
+def _valid_video_id(value):
+    return value if value and _VIDEO_ID.fullmatch(value) else None
+
+
+def _route_youtube(query, host, parsed):
+    params = urllib.parse.parse_qs(parsed.query)
+    segments = [segment for segment in parsed.path.split('/') if segment]
+
+    if host in YOUTU_BE_HOSTS:
+        video_id = _valid_video_id(segments[0] if segments else None)
+    elif segments[:1] == ['watch']:
+        video_id = _valid_video_id(params.get('v', [None])[0])
+    elif len(segments) >= 2 and segments[0] in YOUTUBE_ID_PATHS:
+        video_id = _valid_video_id(segments[1])
+    else:
+        video_id = None
+
+    playlist_id = params.get('list', [None])[0]
+    if playlist_id and _PLAYLIST_ID.fullmatch(playlist_id):
+        return Route(YOUTUBE_PLAYLIST, query, video_id=video_id, playlist_id=playlist_id)
+    if video_id:
+        return Route(YOUTUBE_VIDEO, query, video_id=video_id)
+    # Channels, users, feeds: let yt-dlp decide
+    return Route(URL, query)
+
+
+def _route_spotify(query, parsed):
+    segments = [segment for segment in parsed.path.split('/') if segment]
+    # Localized links look like /intl-de/track/<id>
+    if segments and segments[0].startswith('intl-'):
+        segments = segments[1:]
+    if len(segments) >= 2 and segments[0] == 'track' and _SPOTIFY_ID.fullmatch(segments[1]):
+        return Route(SPOTIFY_TRACK, query, spotify_id=segments[1])
+    return Route(URL, query)
+
+
+def classify(query):
+    """Classify a %play query into a Route."""
+    query = query.strip()
+
+    uri = _SPOTIFY_URI.fullmatch(query)
+    if uri:
+        return Route(SPOTIFY_TRACK, query, spotify_id=uri.group(1))
+
+    if not _URL.fullmatch(query):
+        if not _BARE_KNOWN_HOST.fullmatch(query):
+            return Route(SEARCH, query)
+        query = f"https://{query}"
+
+    parsed = urllib.parse.urlsplit(query)
+    host = (parsed.hostname or '').lower()
+
+    if host in YOUTUBE_HOSTS or host in YOUTU_BE_HOSTS:
+        return _route_youtube(query, host, parsed)
+    if host in SPOTIFY_HOSTS:
+        return _route_spotify(query, parsed)
+    return Route(URL, query)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger('music_cog')
+
+# > Resource Scheduler <
+# Admission control for expensive work (yt-dlp jobs, ffmpeg processes).
+# A job needs a slot under both the global cap and its guild's cap. Waiting
+# jobs are granted by priority first (current track, then prefetch, then
+# cache warming), and guilds take turns within a priority so one guild's
+# burst of %play commands cannot starve the others. When too many jobs are
+# already waiting, new ones are rejected instead of piling up.
+
+PRIORITY_CURRENT = 0  # The track a guild is about to play
+PRIORITY_PREFETCH = 1  # Upcoming tracks in a queue
+PRIORITY_WARM = 2  # Speculative cache warming, never queued
+
+
+class SchedulerSaturated(Exception):
+    """Raised when a job cannot be admitted because the scheduler is full."""
+
+
+class ResourceScheduler:
+    """Priority- and guild-fair semaphore with global and per-guild caps."""
+
+    def __init__(self, name, global_limit, per_guild_limit=None, max_waiting=100):
+        self.name = name
+        self.global_limit = global_limit
+        self.per_guild_limit = per_guild_limit
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.active_by_guild = {}
+        # One round-robin ring per priority: guild id -> deque of waiting futures
+        self.waiting = [OrderedDict() for _ in (PRIORITY_CURRENT, PRIORITY_PREFETCH, PRIORITY_WARM)]
+        self.waiting_count = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def _guild_has_room(self, guild_id):
+        if self.per_guild_limit is None:
+            return True
+        return self.active_by_guild.get(guild_id, 0) < self.per_guild_limit
+
+    def _grant(self, guild_id):
+        self.active += 1
+        self.active_by_guild[guild_id] = self.active_by_guild.get(guild_id, 0) + 1
+        self.admitted += 1
+
+    def _next_waiter(self):
+        """Pop the next waiter in line: best priority first, guilds in turn."""
+        for ring in self.waiting:
+            for guild_id in list(ring):
+                if not self._guild_has_room(guild_id):
+                    continue
+                waiters = ring[guild_id]
+                future = waiters.popleft()
+                self.waiting_count -= 1
+                if waiters:
+                    # This guild goes to the back of the line
+                    ring.move_to_end(guild_id)
+                else:
+                    del ring[guild_id]
+                return guild_id, future
+        return None, None
+
+    def _dispatch(self):
+        """Hand free slots to waiting jobs."""
+        while self.active < self.global_limit:
+            guild_id, future = self._next_waiter()
+            if future is None:
+                return
+            if future.done():
+                # Cancelled before its turn; the waiter has given up but not yet left the queue
+                continue
+            self._grant(guild_id)
+            future.set_result(None)
+
+    def _forget(self, priority, guild_id, future):
+        ring = self.waiting[priority]
+        waiters = ring.get(guild_id)
+        if waiters is not None and future in waiters:
+            waiters.remove(future)
+            self.waiting_count -= 1
+            if not waiters:
+                del ring[guild_id]
+
+    async def acquire(self, guild_id, priority=PRIORITY_CURRENT):
+        """Wait for a slot; every successful call must be paired with ``release``."""
+        idle = self.active < self.global_limit and self._guild_has_room(guild_id)
+        if idle and not self.waiting_count:
+            self._grant(guild_id)
+            return
+
+        if priority == PRIORITY_WARM or self.waiting_count >= self.max_waiting:
+            self.rejected += 1
+            raise SchedulerSaturated(
+                f"{self.name}: {self.active} running, {self.waiting_count} waiting"
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[priority].setdefault(guild_id, deque()).append(future)
+        self.waiting_count += 1
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as the waiter gave up: pass the slot on
+                self.release(guild_id)
+            else:
+                self._forget(priority, guild_id, future)
+            raise
+
+    def release(self, guild_id):
+        self.active -= 1
+        remaining = self.active_by_guild.get(guild_id, 1) - 1
+        if remaining > 0:
+            self.active_by_guild[guild_id] = remaining
+        else:
+            self.active_by_guild.pop(guild_id, None)
+        self._dispatch()
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'limit': self.global_limit,
+            'guild_limit': self.per_guild_limit,
+            'waiting': self.waiting_count,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+        }
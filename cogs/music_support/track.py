@@ -0,0 +1,127 @@
+import time
+import urllib.parse
+
+# > Track Records <
+# Queue entries carry everything needed to render and play them, resolved
+# once when the track is added, so listing the queue or announcing a track
+# never has to go back to yt-dlp.
+
+DEFAULT_STREAM_TTL = 3600  # Used when a stream URL does not say when it expires
+EXPIRY_MARGIN = 60  # Treat a URL as expired this many seconds early
+
+
+def format_duration(seconds):
+    """Format duration from seconds to MM:SS"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    else:
+        return f"{minutes}:{seconds:02d}"
+
+
+def parse_stream_expiry(stream_url, default_ttl=DEFAULT_STREAM_TTL):
+    """Return the unix time a stream URL stops working.
+
+    googlevideo (and Piped/Invidious proxied) URLs embed it as ``expire=``,
+    either in the query string or as a ``/expire/<ts>/`` path segment.
+    Anything else gets ``default_ttl`` from now.
+    """
+    parsed = urllib.parse.urlparse(stream_url)
+    expire = urllib.parse.parse_qs(parsed.query).get('expire')
+    if expire:
+        value = expire[0]
+    else:
+        parts = parsed.path.split('/')
+        value = parts[parts.index('expire') + 1] if 'expire' in parts[:-1] else None
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return time.time() + default_ttl
+
+
+class Track:
+    """A queued track and whatever has been resolved about it so far."""
+
+    __slots__ = (
+        'webpage_url', 'title', 'duration', 'video_id', 'extractor',
+        'stream_url', 'expires_at', 'is_local', 'requested_at'
+    )
+
+    def __init__(self, webpage_url, title=None, duration=None, video_id=None, extractor=None):
+        self.webpage_url = webpage_url
+        self.title = title
+        self.duration = duration
+        self.video_id = video_id
+        self.extractor = extractor
+        self.stream_url = None
+        self.expires_at = None
+        self.is_local = False
+        self.requested_at = None  # perf_counter() of the command, if it starts playing right away
+
+    @classmethod
+    def from_search_result(cls, entry):
+        return cls(
+            entry['webpage_url'],
+            title=entry.get('title'),
+            duration=entry.get('duration'),
+            video_id=entry.get('id'),
+            extractor='youtube'
+        )
+
+    @classmethod
+    def from_playlist_entry(cls, entry):
+        """Build a track from a flat playlist entry without resolving it."""
+        video_id = entry.get('id')
+        return cls(
+            f"https://www.youtube.com/watch?v={video_id}" if video_id else entry['url'],
+            title=entry.get('title'),
+            duration=entry.get('duration'),
+            video_id=video_id,
+            extractor='youtube'
+        )
+
+    @property
+    def display_title(self):
+        return self.title or self.webpage_url
+
+    @property
+    def duration_string(self):
+        if not self.duration:
+            return 'Unknown'
+        return format_duration(self.duration)
+
+    def stream_valid(self, margin=EXPIRY_MARGIN):
+        """True if the stored stream URL can still be played."""
+        if not self.stream_url:
+            return False
+        if self.expires_at is None:
+            return True
+        return self.expires_at - margin > time.time()
+
+    def set_stream(self, stream_url, is_local=False):
+        self.stream_url = stream_url
+        self.is_local = is_local
+        self.expires_at = None if is_local else parse_stream_expiry(stream_url)
+
+    def clear_stream(self):
+        self.stream_url = None
+        self.expires_at = None
+        self.is_local = False
+
+    def update_from_info(self, info):
+        """Fill in metadata (and the stream URL, if any) from a yt-dlp info dict."""
+        self.title = info.get('title') or self.title
+        self.duration = info.get('duration') or self.duration
+        self.video_id = info.get('id') or self.video_id
+        self.extractor = (info.get('extractor_key') or info.get('ie_key') or self.extractor or '').lower() or None
+        if info.get('url'):
+            self.set_stream(info['url'])
+
+    def update_from_stream_data(self, stream_data):
+        """Fill in whatever a resolver returned for this track."""
+        if stream_data.get('title') and (not self.title or self.title == 'Unknown Title'):
+            self.title = stream_data['title']
+        self.duration = stream_data.get('duration') or self.duration
+        self.set_stream(stream_data['url'], is_local=stream_data.get('is_local', False))
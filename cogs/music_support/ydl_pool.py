@@ -0,0 +1,102 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import yt_dlp
+
+logger = logging.getLogger('music_cog')
+
+# > Warm yt-dlp Instances <
+# Building a YoutubeDL is not free: it loads cookies, sets up its networking
+# stack and creates extractor instances on first use. The YouTube extractor
+# also keeps the deciphered player JavaScript in memory, on that instance.
+# Every resolver worker thread therefore keeps its own YoutubeDL per option
+# set and reuses it across extractions. A YoutubeDL is not thread-safe, so
+# instances are never shared between threads. All instances share a
+# persistent cache directory, so player JS and signature functions also
+# survive restarts.
+#
+# Option sets carrying callables (per-download progress hooks) cannot be
+# told apart by value; they get a fresh instance every time, which still
+# benefits from the on-disk cache.
+
+MAX_INSTANCES_PER_THREAD = 4  # Option sets kept warm per worker (e.g. default, search, old cookies)
+
+
+def options_key(opts):
+    """Value-based key for an option set, or None if it cannot be pooled."""
+    try:
+        return json.dumps(opts, sort_keys=True)
+    except (TypeError, ValueError):
+        return None  # Callables such as progress hooks
+
+
+class YoutubeDLPool:
+    """Per-thread pool of reusable YoutubeDL instances."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = str(cache_dir)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.uncached = 0
+        self.setup_time = 0.0
+
+    def _options(self, opts):
+        opts = dict(opts)
+        opts.setdefault('cachedir', self.cache_dir)
+        return opts
+
+    def _create(self, opts):
+        started = time.perf_counter()
+        ydl = yt_dlp.YoutubeDL(self._options(opts))
+        with self.lock:
+            self.created += 1
+            self.setup_time += time.perf_counter() - started
+        return ydl
+
+    @contextmanager
+    def instance(self, opts):
+        """A YoutubeDL for ``opts`` that only the calling thread uses."""
+        key = options_key(opts)
+        if key is None:
+            with self.lock:
+                self.uncached += 1
+            with self._create(opts) as ydl:
+                yield ydl
+            return
+
+        instances = getattr(self.local, 'instances', None)
+        if instances is None:
+            instances = self.local.instances = OrderedDict()
+
+        ydl = instances.get(key)
+        if ydl is None:
+            ydl = instances[key] = self._create(opts)
+            while len(instances) > MAX_INSTANCES_PER_THREAD:
+                _, stale = instances.popitem(last=False)
+                stale.close()
+        else:
+            instances.move_to_end(key)
+            with self.lock:
+                self.reused += 1
+        yield ydl
+
+    def warm(self, opts, extractors=('Youtube',)):
+        """Build this thread's instance for ``opts`` and its extractors ahead of time."""
+        with self.instance(opts) as ydl:
+            for name in extractors:
+                ydl.get_info_extractor(name)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'uncached': self.uncached,
+                'avg_setup': self.setup_time / self.created if self.created else 0.0,
+            }
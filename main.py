@@ -4,6 +4,8 @@ import os
 import asyncio
 from dotenv import load_dotenv
 
+from bot_logging import setup_logging
+
 # Load .env
 load_dotenv('.env')
 
@@ -30,4 +32,8 @@ async def main():
         await load()
         await bot.start(os.getenv("TOKEN"))
 
-asyncio.run(main())
+# Guarded because extraction worker processes (MUSIC_EXTRACTION_PROCESSES) re-import this module
+if __name__ == '__main__':
+    # Queue-backed logging to the console and .private/bot.log, set up before any cog logs
+    setup_logging()
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+import asyncio
+import unittest
+
+from cogs.music_support.scheduler import ResourceScheduler
+
+
+class CancelledWaiterTest(unittest.IsolatedAsyncioTestCase):
+    """A waiter cancelled before its turn must not be granted (and leak) a slot."""
+
+    async def test_release_skips_cancelled_waiter(self):
+        scheduler = ResourceScheduler('test', global_limit=1)
+        await scheduler.acquire('a')
+        waiter = asyncio.ensure_future(scheduler.acquire('b'))
+        await asyncio.sleep(0)
+
+        # The waiter is cancelled, and a release runs before it leaves the queue
+        waiter.cancel()
+        scheduler.release('a')
+
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(scheduler.active, 0)
+        self.assertEqual(scheduler.active_by_guild, {})
+        self.assertEqual(scheduler.waiting_count, 0)
+
+    async def test_next_waiter_gets_the_slot(self):
+        scheduler = ResourceScheduler('test', global_limit=1, per_guild_limit=2)
+        await scheduler.acquire('a')
+        cancelled = asyncio.ensure_future(scheduler.acquire('b'))
+        granted = asyncio.ensure_future(scheduler.acquire('b'))
+        await asyncio.sleep(0)
+
+        cancelled.cancel()
+        scheduler.release('a')
+
+        await asyncio.wait_for(granted, 1)
+        self.assertEqual(scheduler.active_by_guild, {'b': 1})
+        scheduler.release('b')
+        self.assertEqual(scheduler.active, 0)
+
+    async def test_timed_out_acquire_does_not_leak(self):
+        scheduler = ResourceScheduler('test', global_limit=1, per_guild_limit=2)
+        await scheduler.acquire('a')
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(scheduler.acquire('b'), 0.01)
+        scheduler.release('a')
+
+        self.assertEqual(scheduler.active, 0)
+        self.assertEqual(scheduler.active_by_guild, {})
+
+
+if __name__ == '__main__':
+    unittest.main()